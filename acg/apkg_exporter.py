@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import time
+import zipfile
+
+from data.card import Card, read_cards, select_cards
+from data.rendering import DEFAULT_RENDERER, DEFINITION_RATIO, FIELD_NAMES, MAX_DEFINITIONS, CardRenderer
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Number of notes & cards inserted at once
+BATCH_SIZE = 1000
+
+FRONT_TEMPLATE = """<div class="word">{{Front}}</div>
+<div class="pos">{{PartOfSpeech}}</div>"""
+
+BACK_TEMPLATE = """{{FrontSide}}
+<hr id="answer">
+{{Back}}
+{{Audio}}
+<div class="link"><a href="{{WikiLink}}">Wiktionary</a></div>"""
+
+CSS = """.card { font-family: arial; font-size: 20px; text-align: center; color: black; background-color: white; }
+.pos { font-size: 14px; color: grey; }
+.parenthesed { font-size: 14px; color: grey; }
+ol { display: inline-block; text-align: left; }
+.link { font-size: 12px; }"""
+
+# Anki collection schema version 11, which all Anki versions can import
+SCHEMA = """
+CREATE TABLE col (
+    id integer primary key, crt integer not null, mod integer not null, scm integer not null,
+    ver integer not null, dty integer not null, usn integer not null, ls integer not null,
+    conf text not null, models text not null, decks text not null, dconf text not null, tags text not null
+);
+CREATE TABLE notes (
+    id integer primary key, guid text not null, mid integer not null, mod integer not null,
+    usn integer not null, tags text not null, flds text not null, sfld integer not null,
+    csum integer not null, flags integer not null, data text not null
+);
+CREATE TABLE cards (
+    id integer primary key, nid integer not null, did integer not null, ord integer not null,
+    mod integer not null, usn integer not null, type integer not null, queue integer not null,
+    due integer not null, ivl integer not null, factor integer not null, reps integer not null,
+    lapses integer not null, left integer not null, odue integer not null, odid integer not null,
+    flags integer not null, data text not null
+);
+CREATE TABLE revlog (
+    id integer primary key, cid integer not null, usn integer not null, ivl integer not null,
+    lastIvl integer not null, factor integer not null, time integer not null, type integer not null
+);
+CREATE TABLE graves (usn integer not null, oid integer not null, type integer not null);
+CREATE INDEX ix_notes_usn on notes (usn);
+CREATE INDEX ix_cards_usn on cards (usn);
+CREATE INDEX ix_revlog_usn on revlog (usn);
+CREATE INDEX ix_cards_nid on cards (nid);
+CREATE INDEX ix_cards_sched on cards (did, queue, due);
+CREATE INDEX ix_revlog_cid on revlog (cid);
+CREATE INDEX ix_notes_csum on notes (csum);
+"""
+
+DECK_CONFIG = {
+    "id": 1, "name": "Default", "mod": 0, "usn": 0, "maxTaken": 60, "autoplay": True, "timer": 0,
+    "replayq": True, "dyn": False,
+    "new": {"delays": [1, 10], "ints": [1, 4, 7], "initialFactor": 2500, "order": 1, "perDay": 20,
+        "bury": True, "separate": True},
+    "rev": {"perDay": 200, "ease4": 1.3, "fuzz": 0.05, "minSpace": 1, "ivlFct": 1, "maxIvl": 36500,
+        "bury": True, "hardFactor": 1.2},
+    "lapse": {"delays": [10], "mult": 0, "minInt": 1, "leechFails": 8, "leechAction": 0},
+}
+
+_HTML_TAG = re.compile(r"<[^>]*>")
+
+
+def _stable_id(*parts: str) -> int:
+    """
+    Derive a positive id from the given strings, such that repeated exports
+    produce identical ids.
+    """
+    return int(hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()[:12], 16)
+
+
+def _checksum(field: str) -> int:
+    return int(hashlib.sha1(_HTML_TAG.sub("", field).encode("utf-8")).hexdigest()[:8], 16)
+
+
+def _deck(deck_id: int, name: str, timestamp: int) -> dict:
+    return {
+        "id": deck_id, "name": name, "mod": timestamp, "usn": -1, "desc": "", "dyn": 0, "conf": 1,
+        "collapsed": False, "browserCollapsed": False, "extendNew": 0, "extendRev": 0,
+        "newToday": [0, 0], "revToday": [0, 0], "lrnToday": [0, 0], "timeToday": [0, 0],
+    }
+
+
+def _model(model_id: int, name: str, deck_id: int, timestamp: int) -> dict:
+    return {
+        "id": model_id, "name": name, "type": 0, "mod": timestamp, "usn": -1, "sortf": 0, "did": deck_id,
+        "flds": [
+            {"name": field, "ord": index, "sticky": False, "rtl": False, "font": "Arial", "size": 20, "media": []}
+            for index, field in enumerate(FIELD_NAMES)
+        ],
+        "tmpls": [
+            {"name": "Card 1", "ord": 0, "qfmt": FRONT_TEMPLATE, "afmt": BACK_TEMPLATE, "did": None,
+                "bqfmt": "", "bafmt": ""},
+        ],
+        "css": CSS,
+        "latexPre": "\\documentclass[12pt]{article}\n\\special{papersize=3in,5in}\n\\usepackage{amssymb,amsmath}\n"
+            + "\\pagestyle{empty}\n\\setlength{\\parindent}{0in}\n\\begin{document}\n",
+        "latexPost": "\\end{document}",
+        "req": [[0, "any", [0]]],
+        "tags": [],
+        "vers": [],
+    }
+
+
+def _note_rows(cards: List[Card], model_id: int, deck_id: int, timestamp: int, occurrences: Dict[Tuple[str, str], int],
+        renderer: CardRenderer = DEFAULT_RENDERER) -> Iterator[Tuple[tuple, tuple]]:
+    """
+    Turn cards into rows of the notes & cards tables, rendering their fields
+    at once. Cards are due in the order of their rank, such that they don't
+    need to be sorted beforehand.
+
+    Cards sharing their word and part of speech with earlier ones, e.g. those
+    of several etymologies, are told apart by the number of such earlier
+    cards, which is counted in 'occurrences'.
+    """
+    for card, values in zip(cards, renderer.render_batch(cards)):
+        key = (card.word, card.pos)
+        occurrence = occurrences.get(key, 0)
+        occurrences[key] = occurrence + 1
+
+        # The first card keeps the ids of former exports, such that re-importing them updates its note
+        parts = key if occurrence == 0 else key + (str(occurrence),)
+        note_id = _stable_id("note", *parts)
+        guid = "%x" % _stable_id("guid", *parts)
+
+        yield (
+            (note_id, guid, model_id, timestamp, -1, "", "\x1f".join(values), values[0], _checksum(values[0]), 0, ""),
+            (note_id, note_id, deck_id, 0, timestamp, -1, 0, 0, card.rank, 0, 0, 0, 0, 0, 0, 0, 0, ""),
+        )
+
+
+class ApkgWriter():
+    """
+    Builds a standalone Anki package from cards written to it one at a time,
+    consisting of an SQLite collection and the TTS audio files referenced by
+    the cards, without requiring a local Anki installation. Cards without
+    definitions are skipped. The package is written by 'close'.
+    """
+
+    def __init__(self, output_path: str, deck_name: str, model_name: str, media_dir: str,
+            batch_size: int = BATCH_SIZE, renderer: CardRenderer = DEFAULT_RENDERER):
+        self.output_path = output_path
+        self.media_dir = media_dir
+        self.batch_size = batch_size
+        self.renderer = renderer
+        self.timestamp = int(os.environ.get("SOURCE_DATE_EPOCH", time.time()))
+        self.deck_id = 1 if deck_name == "Default" else _stable_id("deck", deck_name)
+        self.model_id = _stable_id("model", model_name)
+        self.batch = []
+        self.words = set()
+        self.occurrences = {}
+
+        decks = {
+            deck["id"]: deck
+            for deck in [ _deck(1, "Default", self.timestamp), _deck(self.deck_id, deck_name, self.timestamp) ]
+        }
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.collection_path = os.path.join(self.temp_dir.name, "collection.anki2")
+        self.connection = sqlite3.connect(self.collection_path)
+        self.connection.executescript(SCHEMA)
+
+        # All rows are inserted within a single transaction, committed by 'close'
+        self.connection.execute("INSERT INTO col VALUES (1, ?, ?, ?, 11, 0, 0, 0, ?, ?, ?, ?, '{}')", (
+            self.timestamp, self.timestamp * 1000, self.timestamp * 1000,
+            json.dumps({"nextPos": 1, "curDeck": self.deck_id, "curModel": self.model_id}),
+            json.dumps({str(self.model_id): _model(self.model_id, model_name, self.deck_id, self.timestamp)}),
+            json.dumps({ str(deck["id"]): deck for deck in decks.values() }),
+            json.dumps({"1": DECK_CONFIG}),
+        ))
+
+    def write(self, card: Card):
+        if not card.has_definitions():
+            return
+
+        self.words.add(card.word)
+        self.batch.append(card)
+        if len(self.batch) >= self.batch_size:
+            self._insert_batch()
+
+    def _insert_batch(self):
+        rows = list(_note_rows(self.batch, self.model_id, self.deck_id, self.timestamp, self.occurrences,
+            self.renderer))
+        self.connection.executemany("INSERT INTO notes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [ note for note, _ in rows ])
+        self.connection.executemany("INSERT INTO cards VALUES "
+            "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [ card for _, card in rows ])
+        self.batch = []
+
+    def close(self) -> int:
+        """
+        Write the package and return the number of notes it contains.
+        """
+        if self.batch:
+            self._insert_batch()
+        self.connection.commit()
+        note_count = self.connection.execute("SELECT count() FROM notes").fetchone()[0]
+        self.connection.close()
+
+        # Media files are stored under consecutive numbers, mapped to their names by the 'media' entry
+        media_files = [
+            filename
+            for filename in sorted("%s.mp3" % word for word in self.words)
+            if os.path.isfile(os.path.join(self.media_dir, filename))
+        ]
+
+        with zipfile.ZipFile(self.output_path, "w", zipfile.ZIP_DEFLATED) as package:
+            package.write(self.collection_path, "collection.anki2")
+            for index, filename in enumerate(media_files):
+                package.write(os.path.join(self.media_dir, filename), str(index), compress_type=zipfile.ZIP_STORED)
+            package.writestr("media", json.dumps({ str(index): filename for index, filename in enumerate(media_files) }))
+
+        self.temp_dir.cleanup()
+        print("Exported %d notes and %d media files to %s" % (note_count, len(media_files), self.output_path))
+        return note_count
+
+
+def export_apkg(json_path: str, output_path: str, deck_name: str, model_name: str, media_dir: str,
+        min_rank: Optional[int] = None, max_rank: Optional[int] = None, top_n: Optional[int] = None,
+        renderer: CardRenderer = DEFAULT_RENDERER):
+    """
+    Export the card data into a standalone Anki package. Only cards within the
+    given rank range are exported, optionally limited to the 'top_n' most
+    frequent ones.
+    """
+    apkg_writer = ApkgWriter(output_path, deck_name, model_name, media_dir, renderer=renderer)
+    for card in select_cards(read_cards(json_path), min_rank, max_rank, top_n, ordered=False):
+        apkg_writer.write(card)
+    return apkg_writer.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export card data into a standalone Anki package (.apkg).')
+    parser.add_argument("-j", "--json-file", required=True,
+        help="JSON Lines file containing data with which to create cards")
+    parser.add_argument("-o", "--output-file", default="deck.apkg",
+        help="Anki package to create")
+    parser.add_argument("-d", "--deck-name", default="Default",
+        help="Name of the card deck into which to add cards")
+    parser.add_argument("-m", "--model-name", default="AnkiDecking",
+        help="Name of the note type (model) to be created for the cards")
+    parser.add_argument("--media-dir", default="resources/tts",
+        help="Directory containing the TTS audio files referenced by the cards")
+    parser.add_argument("--min-rank", type=int,
+        help="Skip cards of words ranked before this rank in the frequency list, whatever their part of speech")
+    parser.add_argument("--max-rank", type=int,
+        help="Skip cards of words ranked after this rank in the frequency list, whatever their part of speech")
+    parser.add_argument("-n", "--top-n", type=int,
+        help="Only export this many cards of the most frequent words within the rank range")
+    parser.add_argument("--max-definitions", type=int, default=MAX_DEFINITIONS,
+        help="Maximum number of definitions shown per card")
+    parser.add_argument("--definition-ratio", type=float, default=DEFINITION_RATIO,
+        help="Share of a card's definitions shown, limited by --max-definitions")
+    args = parser.parse_args()
+
+    export_apkg(args.json_file, args.output_file, args.deck_name, args.model_name, args.media_dir,
+        args.min_rank, args.max_rank, args.top_n, CardRenderer(args.max_definitions, args.definition_ratio))
@@ -0,0 +1,4 @@
+"""
+Benchmarks for the individual stages of the card generation pipeline. Run them
+from within the 'acg' directory, e.g. 'python -m benchmark.parser_backends'.
+"""
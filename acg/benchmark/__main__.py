@@ -0,0 +1,270 @@
+"""
+Benchmark the stages of the card generation separately on synthetic data,
+reporting pages/sec, cards/sec and peak RSS per stage, and optionally compare
+the results against a baseline stored by an earlier run, e.g.
+
+    python -m benchmark --save-baseline baseline.json
+    python -m benchmark --baseline baseline.json
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from benchmark import synthetic
+from data.card import Card, CardWriter, read_cards
+
+BENCHMARKS = ('filter', 'cards', 'templates', 'serialization', 'rendering', 'import', 'export')
+
+# Relative change of a metric beyond which it counts as a regression
+DEFAULT_TOLERANCE = 0.1
+
+
+def _setup_filter(directory: str, args):
+    from language_filter import filter_wiki_dump, read_frequency_list
+
+    frequency_list = read_frequency_list(os.path.join(directory, "wordlist.csv"))
+    output_file = os.path.join(directory, "filtered.xml")
+    return lambda: filter_wiki_dump(os.path.join(directory, "dump.xml"), frequency_list, output_file, 'Finnish'), \
+        args.pages, None
+
+
+def _setup_cards(directory: str, args):
+    from card_data_generator import generate_card_data
+
+    output_file = os.path.join(directory, "cards-output.jsonl")
+
+    def run():
+        generate_card_data(os.path.join(directory, "dictionary.xml"), output_file, 'Finnish')
+        with open(output_file, "r", encoding="utf-8") as card_file:
+            return None, sum(1 for _ in card_file)
+
+    return run, args.entries, None
+
+
+def _setup_templates(directory: str, args):
+    from template_processor import TEMPLATE_CACHE_SIZE, TemplateProcessor
+
+    # Definitions of all entries, whose templates are expanded with a cache as configured by default
+    pages = []
+    with open(os.path.join(directory, "dictionary.xml"), "r", encoding="utf-8") as dictionary:
+        for line in dictionary:
+            if line.startswith("  <entry>"):
+                pages.append([])
+            elif line.startswith("# "):
+                pages[-1].append(line[2:].strip())
+    TemplateProcessor.configure_cache(TEMPLATE_CACHE_SIZE)
+
+    def run():
+        for definitions in pages:
+            for definition in definitions:
+                TemplateProcessor.process_templates(definition)
+
+    return run, len(pages), None
+
+
+def _setup_serialization(directory: str, args):
+    cards = list(read_cards(os.path.join(directory, "cards.jsonl")))
+
+    def run():
+        for line in [ card.dumps() for card in cards ]:
+            Card.loads(line)
+
+    return run, None, len(cards)
+
+
+def _setup_rendering(directory: str, args):
+    from data.rendering import CardRenderer
+
+    cards = list(read_cards(os.path.join(directory, "cards.jsonl")))
+    renderer = CardRenderer()
+    return lambda: renderer.render_batch(cards), None, len(cards)
+
+
+def _setup_import(directory: str, args):
+    from anki.storage import Collection
+    from apkg_exporter import BACK_TEMPLATE, FRONT_TEMPLATE
+    from card_generator import fill
+    from data.rendering import FIELD_NAMES
+
+    collection = Collection(os.path.join(directory, "collection.anki2"))
+    models = collection.models
+    model = models.new("AnkiDecking")
+    for field in FIELD_NAMES:
+        models.addField(model, models.newField(field))
+    template = models.newTemplate("Card 1")
+    template['qfmt'] = FRONT_TEMPLATE
+    template['afmt'] = BACK_TEMPLATE
+    models.addTemplate(model, template)
+    models.add(model)
+
+    def run():
+        cards = fill(collection, collection.decks.get(1), os.path.join(directory, "cards.jsonl"), model)
+        collection.save()
+        return None, cards
+
+    return run, None, None
+
+
+def _setup_export(directory: str, args):
+    from apkg_exporter import export_apkg
+
+    def run():
+        cards = export_apkg(os.path.join(directory, "cards.jsonl"), os.path.join(directory, "deck.apkg"),
+            "Default", "AnkiDecking", directory)
+        return None, cards
+
+    return run, None, None
+
+
+SETUPS = {
+    'filter': _setup_filter,
+    'cards': _setup_cards,
+    'templates': _setup_templates,
+    'serialization': _setup_serialization,
+    'rendering': _setup_rendering,
+    'import': _setup_import,
+    'export': _setup_export,
+}
+
+
+def _run_benchmark(name: str, directory: str, args, results):
+    try:
+        run, pages, cards = SETUPS[name](directory, args)
+    except ImportError as error:
+        results.put({'skipped': str(error)})
+        return
+
+    best = float('inf')
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            counts = run()
+            best = min(best, time.perf_counter() - start)
+    if isinstance(counts, tuple):
+        pages, cards = counts[0] or pages, counts[1] or cards
+
+    # 'ru_maxrss' is reported in kilobytes on Linux
+    results.put({
+        'seconds': best,
+        'pages_per_sec': pages / best if pages else None,
+        'cards_per_sec': cards / best if cards else None,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    })
+
+
+def measure(name: str, directory: str, args) -> dict:
+    """
+    Run a benchmark in a separate process, such that its peak RSS is not
+    affected by the others.
+    """
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run_benchmark, args=(name, directory, args, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def prepare(directory: str, args):
+    languages = dict(language.split(':') if ':' in language else (language, 1) for language in args.languages)
+    languages = { language: float(weight) for language, weight in languages.items() }
+
+    with open(os.path.join(directory, "dump.xml"), "w", encoding="utf-8") as dump_file:
+        synthetic.write_dump(dump_file, args.pages, languages, template_density=args.template_density)
+    with open(os.path.join(directory, "wordlist.csv"), "w", encoding="utf-8") as freq_file:
+        synthetic.write_frequency_list(freq_file, args.pages)
+    with open(os.path.join(directory, "dictionary.xml"), "w", encoding="utf-8") as dictionary:
+        synthetic.write_entries(dictionary, args.entries, template_density=args.template_density)
+    with open(os.path.join(directory, "cards.jsonl"), "w", encoding="utf-8") as card_file:
+        writer = CardWriter(card_file)
+        for index in range(args.cards):
+            writer.write(Card(synthetic.word(index), "Noun", index + 1,
+                [ "definition %d of <span class=\"parenthesed\">(%s)</span>" % (number, synthetic.word(index))
+                    for number in range(3) ]))
+
+
+def _format(value, pattern: str) -> str:
+    return pattern % value if value is not None else "-"
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Return the regressions of the results compared to the baseline, i.e.
+    throughputs which dropped or peak RSS which grew beyond the tolerance.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base or 'skipped' in result or 'skipped' in base:
+            continue
+        for metric in ('pages_per_sec', 'cards_per_sec'):
+            if result.get(metric) and base.get(metric) and result[metric] < base[metric] * (1 - tolerance):
+                regressions.append("%s: %s dropped from %.0f to %.0f" % (name, metric, base[metric], result[metric]))
+        if result['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance):
+            regressions.append("%s: peak RSS grew from %.1f to %.1f MB" % (name, base['peak_rss_mb'],
+                result['peak_rss_mb']))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--benchmarks', '-b', nargs='+', choices=BENCHMARKS, default=BENCHMARKS,
+                    help='Benchmarks to run, all by default.')
+    parser.add_argument('--pages', '-n', type=int, default=20_000,
+                    help='Number of pages in the synthetic dump.')
+    parser.add_argument('--entries', type=int, default=2_000,
+                    help='Number of entries in the synthetic filtered dictionary.')
+    parser.add_argument('--cards', type=int, default=100_000,
+                    help='Number of synthetic cards to serialize, import and export.')
+    parser.add_argument('--languages', nargs='+', default=['Finnish', 'English', 'German'],
+                    help='Languages of the pages of the synthetic dump, optionally weighted, e.g. "Finnish:3".')
+    parser.add_argument('--template-density', type=int, default=0,
+                    help='Number of additional definitions consisting of templates per language section.')
+    parser.add_argument('--repeat', '-r', type=int, default=1,
+                    help='Number of repetitions, of which the fastest is reported.')
+    parser.add_argument('--baseline', type=str,
+                    help='JSON file of an earlier run to compare the results against.')
+    parser.add_argument('--save-baseline', type=str,
+                    help='Write the results to this JSON file for later comparisons.')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                    help='Relative change of throughput or peak RSS tolerated before reporting a regression.')
+    args = parser.parse_args()
+
+    parameters = { name: getattr(args, name) for name in ('pages', 'entries', 'cards', 'languages', 'template_density') }
+    results = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        prepare(directory, args)
+
+        print("%-14s %10s %12s %12s %14s" % ("benchmark", "seconds", "pages/sec", "cards/sec", "peak RSS (MB)"))
+        for name in args.benchmarks:
+            result = results[name] = measure(name, directory, args)
+            if 'skipped' in result:
+                print("%-14s skipped (%s)" % (name, result['skipped']))
+                continue
+            print("%-14s %10.2f %12s %12s %14.1f" % (name, result['seconds'], _format(result['pages_per_sec'], "%.0f"),
+                _format(result['cards_per_sec'], "%.0f"), result['peak_rss_mb']))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump({'parameters': parameters, 'results': results}, baseline_file, indent=4)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get('parameters') != parameters:
+            print("Warning: the baseline was measured with different parameters %s" % baseline.get('parameters'))
+
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print("Regression in %s" % regression)
+        if regressions:
+            sys.exit(1)
+        print("No regressions compared to %s" % args.baseline)
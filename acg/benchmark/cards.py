@@ -0,0 +1,102 @@
+"""
+Measure the memory used by 100k cards and the throughput of serializing them
+to and from JSON Lines, comparing the slotted 'Card' and its serialization,
+backed by orjson if installed, against the former dictionary-backed class and
+its serialization as an indented JSON array.
+"""
+
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+from benchmark import synthetic
+from data.card import Card, orjson
+
+
+class LegacyCard():
+
+    def __init__(self, word, pos, rank, definitions):
+        self.word = word
+        self.pos = pos
+        self.rank = rank
+        self.definitions = definitions
+
+    @staticmethod
+    def from_json(json_obj: dict):
+        return LegacyCard(json_obj['word'], json_obj['pos'], json_obj['rank'], json_obj['definitions'])
+
+    def __repr__(self):
+        return json.dumps(self.__dict__, separators=(',', ': '), indent=4)
+
+
+DEFINITIONS = ["first definition", "second definition", "third definition"]
+
+
+def build_cards(card_class, words):
+    return [ card_class(word, "Noun", index + 1, list(DEFINITIONS)) for index, word in enumerate(words) ]
+
+
+def measure_memory(card_class, count: int) -> float:
+    """
+    Memory allocated for the cards and their definition lists, excluding the
+    words shared by both card classes.
+    """
+    words = [ synthetic.word(index) for index in range(count) ]
+    gc.collect()
+    tracemalloc.start()
+    cards = build_cards(card_class, words)
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del cards
+    return allocated / 1024 / 1024
+
+
+def measure_serialization(cards):
+    start = time.perf_counter()
+    lines = [ card.dumps() for card in cards ]
+    dumped = time.perf_counter()
+    for line in lines:
+        Card.loads(line)
+    loaded = time.perf_counter()
+    return dumped - start, loaded - dumped
+
+
+def measure_legacy_serialization(cards):
+    """
+    Serialize the cards as the former card data generator did, writing each
+    card's indented 'repr' followed by a comma into a JSON array, and load
+    the whole array at once as the former card generator did. The trailing
+    comma after the last card, which made the former output invalid JSON, is
+    left out.
+    """
+    start = time.perf_counter()
+    document = "[\n" + ",\n".join(str(card) for card in cards) + "\n]\n"
+    dumped = time.perf_counter()
+    [ LegacyCard.from_json(json_obj) for json_obj in json.loads(document) ]
+    loaded = time.perf_counter()
+    return dumped - start, loaded - dumped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cards', '-n', type=int, default=100_000,
+                    help='Number of cards.')
+    args = parser.parse_args()
+
+    print("%-12s %12s" % ("class", "memory (MB)"))
+    print("%-12s %12.1f" % ("legacy", measure_memory(LegacyCard, args.cards)))
+    print("%-12s %12.1f" % ("slotted", measure_memory(Card, args.cards)))
+    print()
+
+    words = [ synthetic.word(index) for index in range(args.cards) ]
+    cards = build_cards(Card, words)
+    results = [
+        ("legacy", measure_legacy_serialization(build_cards(LegacyCard, words))),
+        ("orjson" if orjson is not None else "json", measure_serialization(cards)),
+    ]
+
+    print("%-12s %14s %14s" % ("serializer", "dumps/sec", "loads/sec"))
+    for name, (dump_time, load_time) in results:
+        print("%-12s %14.0f %14.0f" % (name, args.cards / dump_time, args.cards / load_time))
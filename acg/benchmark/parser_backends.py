@@ -0,0 +1,80 @@
+"""
+Compare the XML parser backends of the language filter and the card data
+generator on a synthetic dump, reporting pages/sec and peak RSS per backend.
+"""
+
+import argparse
+import contextlib
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from benchmark import synthetic
+from card_data_generator import generate_card_data
+from language_filter import filter_wiki_dump, read_frequency_list
+from parser_backends import BACKENDS, etree
+
+
+def _run_stage(stage: str, backend: str, directory: str, results):
+    dump_file = os.path.join(directory, "dump.xml")
+    dictionary_file = os.path.join(directory, "dictionary.xml")
+    output_file = os.path.join(directory, "%s-%s.out" % (stage, backend))
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        if stage == 'filter':
+            frequency_list = read_frequency_list(os.path.join(directory, "wordlist.csv"))
+            filter_wiki_dump(dump_file, frequency_list, output_file, 'Finnish', backend=backend)
+        else:
+            generate_card_data(dictionary_file, output_file, 'Finnish', backend)
+        elapsed = time.perf_counter() - start
+
+    # 'ru_maxrss' is reported in kilobytes on Linux
+    results.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def measure(stage: str, backend: str, directory: str):
+    """
+    Run a stage in a separate process, such that the peak RSS of one backend
+    is not affected by the others.
+    """
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run_stage, args=(stage, backend, directory, results))
+    process.start()
+    elapsed, peak_rss = results.get()
+    process.join()
+    return elapsed, peak_rss
+
+
+def count_entries(dictionary_file: str) -> int:
+    with open(dictionary_file, "r", encoding="utf-8") as dic_file:
+        return sum(1 for line in dic_file if line.startswith("  <entry>"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', '-n', type=int, default=20_000,
+                    help='Number of pages in the synthetic dump.')
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS),
+                    help='Backends to compare.')
+    args = parser.parse_args()
+
+    backends = [ backend for backend in args.backends if backend != 'lxml' or etree is not None ]
+
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "dump.xml"), "w", encoding="utf-8") as dump_file:
+            synthetic.write_dump(dump_file, args.pages)
+        with open(os.path.join(directory, "wordlist.csv"), "w", encoding="utf-8") as freq_file:
+            synthetic.write_frequency_list(freq_file, args.pages)
+
+        print("%-8s %-8s %10s %12s %14s" % ("stage", "backend", "seconds", "pages/sec", "peak RSS (MB)"))
+        for stage in ('filter', 'cards'):
+            for backend in backends:
+                elapsed, peak_rss = measure(stage, backend, directory)
+                if stage == 'filter' and backend == backends[0]:
+                    os.rename(os.path.join(directory, "filter-%s.out" % backend),
+                        os.path.join(directory, "dictionary.xml"))
+                pages = args.pages if stage == 'filter' else count_entries(os.path.join(directory, "dictionary.xml"))
+                print("%-8s %-8s %10.2f %12.0f %14.1f" % (stage, backend, elapsed, pages / elapsed, peak_rss))
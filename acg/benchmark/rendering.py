@@ -0,0 +1,77 @@
+"""
+Measure the throughput of rendering 100k cards into the fields of their notes,
+comparing the batched 'CardRenderer' against the former implementation filling
+a note card by card with repeated string concatenation.
+"""
+
+import argparse
+import time
+
+from benchmark import synthetic
+from data.card import Card
+from data.rendering import FIELD_NAMES, CardRenderer
+
+
+def legacy_fill_into_note(card: Card, note: dict):
+    note['Front'] = card.word
+    note['PartOfSpeech'] = card.pos
+
+    count = len(card.definitions)
+    definitions = card.definitions[:min(3, int(count / 2))]
+    parsed_string = "<ol>\n"
+    for definition in definitions:
+        if len(definition) > 0:
+            parsed_string += "<li>%s</li>\n" % definition
+    parsed_string += "</ol>"
+
+    note['Back'] = parsed_string
+    note['Rank'] = str(card.rank)
+    note['WikiLink'] = "https://en.wiktionary.org/wiki/%s#Finnish" % card.word
+    note['Audio'] = "[sound:%s.mp3]" % card.word
+    return note
+
+
+def build_cards(count: int):
+    return [
+        Card(synthetic.word(index), "Noun", index + 1,
+            [ "definition %d of <span class=\"parenthesed\">(%s)</span>" % (number, synthetic.word(index))
+                for number in range(index % 8) ])
+        for index in range(count)
+    ]
+
+
+def measure(render, cards) -> float:
+    start = time.perf_counter()
+    render(cards)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cards', '-n', type=int, default=100_000,
+                    help='Number of cards.')
+    parser.add_argument('--repeat', '-r', type=int, default=3,
+                    help='Number of repetitions, of which the fastest is reported.')
+    args = parser.parse_args()
+
+    cards = build_cards(args.cards)
+    renderer = CardRenderer()
+
+    # All produce the same fields
+    assert all(
+        tuple(legacy_fill_into_note(card, {})[name] for name in FIELD_NAMES) == renderer.render(card)
+            == tuple(card.fill_into_note({})[name] for name in FIELD_NAMES) == renderer.render_batch([card])[0]
+        for card in cards[:1000]
+    )
+
+    results = [
+        ("legacy", lambda cards: [ legacy_fill_into_note(card, {}) for card in cards ]),
+        ("per card", lambda cards: [ card.fill_into_note({}) for card in cards ]),
+        ("tuples", lambda cards: [ renderer.render(card) for card in cards ]),
+        ("batched", renderer.render_batch),
+    ]
+
+    print("%-12s %14s" % ("rendering", "cards/sec"))
+    for name, render in results:
+        seconds = min(measure(render, cards) for _ in range(args.repeat))
+        print("%-12s %14.0f" % (name, args.cards / seconds))
@@ -0,0 +1,85 @@
+"""
+Compare the per-page parse time of the card data generator's section
+extraction against the previous implementation, which parsed the target
+language section twice more and every definition separately.
+"""
+
+import argparse
+import time
+import wikitextparser as wtp
+
+from benchmark import synthetic
+from card_data_generator import CardDataGenerator
+
+
+def legacy_extract(text: str, target_language: str):
+    parsed_page = wtp.parse(text)
+    target_lang_section = [
+        section.contents
+        for section in parsed_page.sections
+        if section.title == target_language
+    ][0]
+    subsections = wtp.parse(target_lang_section).get_sections(include_subsections=False, level=3) \
+            + wtp.parse(target_lang_section).get_sections(include_subsections=False, level=4)
+
+    return [
+        [ wtp.WikiText(item).plain_text(replace_templates=False).strip()
+            for def_list in section.get_lists() for item in def_list.items ]
+        for section in CardDataGenerator._filter_pos_sections(subsections)
+    ]
+
+
+def current_extract(text: str, target_language: str):
+    parsed_page = wtp.parse(text)
+    subsections = CardDataGenerator._extract_target_lang_sections(parsed_page, target_language)
+
+    return [
+        [ item.strip() for item in CardDataGenerator._plain_text_items(
+            [ item for def_list in section.get_lists() for item in def_list.items ]) ]
+        for section in CardDataGenerator._filter_pos_sections(subsections)
+    ]
+
+
+def synthetic_pages(count: int):
+    """
+    Build pages containing a Finnish section between sections of other
+    languages, as is common for Wiktionary pages.
+    """
+    return [
+        "\n----\n\n".join(
+            synthetic.LANGUAGE_SECTION % {
+                'language': language,
+                'code': synthetic.LANGUAGE_CODES[language],
+                'word': synthetic.word(index),
+            }
+            for language in ('English', 'Finnish', 'German')
+        )
+        for index in range(count)
+    ]
+
+
+def measure(extract, pages, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for page in pages:
+            extract(page, 'Finnish')
+        best = min(best, time.perf_counter() - start)
+    return best / len(pages)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', '-n', type=int, default=2_000,
+                    help='Number of synthetic pages to parse.')
+    parser.add_argument('--repeat', '-r', type=int, default=3,
+                    help='Number of repetitions, of which the fastest is reported.')
+    args = parser.parse_args()
+
+    pages = synthetic_pages(args.pages)
+    assert all(legacy_extract(page, 'Finnish') == current_extract(page, 'Finnish') for page in pages)
+
+    legacy = measure(legacy_extract, pages, args.repeat)
+    current = measure(current_extract, pages, args.repeat)
+    print("before: %8.1f us/page" % (legacy * 1e6))
+    print("after:  %8.1f us/page (%.2fx)" % (current * 1e6, legacy / current))
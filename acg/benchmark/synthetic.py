@@ -0,0 +1,190 @@
+"""
+Generators for synthetic Wiktionary dumps resembling the structure of the
+English Wiktionary 'pages-articles' export, as well as of the filtered
+dictionary written by the language filter.
+"""
+
+import random
+
+from typing import Dict, Sequence, TextIO, Union
+
+DUMP_HEADER = """<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/" version="0.10" xml:lang="en">
+  <siteinfo>
+    <sitename>Wiktionary</sitename>
+    <dbname>enwiktionary</dbname>
+  </siteinfo>
+"""
+
+DUMP_FOOTER = "</mediawiki>\n"
+
+PAGE_TEMPLATE = """  <page>
+    <title>%(title)s</title>
+    <ns>0</ns>
+    <id>%(id)d</id>
+    <revision>
+      <id>%(revision)d</id>
+      <parentid>%(parent)d</parentid>
+      <contributor>
+        <username>Bot</username>
+        <id>1</id>
+      </contributor>
+      <model>wikitext</model>
+      <format>text/x-wiki</format>
+      <text bytes="%(bytes)d" xml:space="preserve">%(text)s</text>
+      <sha1>%(sha1)s</sha1>
+    </revision>
+  </page>
+"""
+
+LANGUAGE_SECTION = """==%(language)s==
+
+===Etymology===
+From {{inh|%(code)s|%(code)s-pro|*%(word)s}}.
+
+===Pronunciation===
+* {{IPA|%(code)s|/%(word)s/}}
+
+===Noun===
+{{%(code)s-noun}}
+
+# {{lb|%(code)s|transitive}} [[%(word)s]], a thing {{q|rare}}
+# {{l|en|house}} (archaic)
+# {{plural of|%(code)s|%(word)s}}
+
+====Declension====
+{{%(code)s-decl|%(word)s}}
+
+===Verb===
+# to %(word)s {{gloss|act}}
+# {{m|%(code)s|%(word)sa||to do}}
+"""
+
+# Templates of additional definitions, '%(code)s' and '%(word)s' being replaced as in the language sections
+DEFINITION_TEMPLATES = [
+    "{{lb|%(code)s|colloquial}}",
+    "{{l|en|%(word)s}}",
+    "{{gloss|%(word)s}}",
+    "{{q|dated}}",
+    "{{m|%(code)s|%(word)s||meaning}}",
+    "{{non-gloss definition|used as {{l|en|%(word)s}}}}",
+    "{{form of|%(code)s|%(word)s}}",
+    "{{%(code)s-unknown|%(word)s}}",
+]
+
+ENTRY_TEMPLATE = """  <entry>
+    <id>%(id)d</id>
+    <title>%(title)s</title>
+    <pos>%(pos)s</pos>
+    <rank>%(rank)d</rank>
+    <revision>%(revision)d</revision>
+    <sha1>%(sha1)s</sha1>
+    <text xml:space="preserve"><![CDATA[
+%(text)s
+    ]]></text>
+  </entry>
+"""
+
+LANGUAGE_CODES = {
+    'English': 'en',
+    'Finnish': 'fi',
+    'German': 'de',
+    'Swedish': 'sv',
+}
+
+
+def word(index: int) -> str:
+    return "sana%d" % index
+
+
+def language_section(rng: random.Random, language: str, index: int, template_density: int = 0) -> str:
+    """
+    Build the section of a word in a language. A template density greater than
+    0 adds as many definitions to its noun section, each containing one to
+    three templates.
+    """
+    values = {
+        'language': language,
+        'code': LANGUAGE_CODES.get(language, 'xx'),
+        'word': word(index),
+    }
+    text = LANGUAGE_SECTION % values
+
+    if template_density > 0:
+        definitions = "".join(
+            "# %s\n" % " ".join(rng.choice(DEFINITION_TEMPLATES) % values for _ in range(rng.randint(1, 3)))
+            for _ in range(template_density)
+        )
+        text = text.replace("\n====Declension====", definitions + "\n====Declension====")
+
+    return text
+
+
+def _pick_language(rng: random.Random, languages: Union[Sequence[str], Dict[str, float]]) -> str:
+    if isinstance(languages, dict):
+        return rng.choices(list(languages), weights=list(languages.values()))[0]
+    return rng.choice(languages)
+
+
+def write_dump(output_file: TextIO, pages: int, languages=('Finnish', 'English', 'German'), seed: int = 0,
+        template_density: int = 0):
+    """
+    Write a dump with the given number of pages, each containing a section in
+    a randomly picked language. Languages may be given as a dictionary mapping
+    them to their relative weights. Every tenth page is a talk page which
+    should be filtered out.
+    """
+    rng = random.Random(seed)
+
+    output_file.write(DUMP_HEADER)
+    for index in range(pages):
+        language = _pick_language(rng, languages)
+        title = word(index) if index % 10 else "Talk:" + word(index)
+        text = language_section(rng, language, index, template_density)
+        text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+        output_file.write(PAGE_TEMPLATE % {
+            'title': title,
+            'id': index + 1,
+            'revision': 1_000_000 + index,
+            'parent': 999_999 + index,
+            'bytes': len(text),
+            'text': text,
+            'sha1': "%031x" % rng.getrandbits(124),
+        })
+    output_file.write(DUMP_FOOTER)
+
+
+def write_entries(output_file: TextIO, entries: int, target_language: str = 'Finnish',
+        languages=('English', 'German'), seed: int = 0, template_density: int = 0):
+    """
+    Write a filtered dictionary with the given number of entries, each
+    containing a section in the target language between sections in randomly
+    picked other languages, as the language filter would keep them.
+    """
+    rng = random.Random(seed)
+
+    output_file.write("<dictionary>\n")
+    for index in range(entries):
+        sections = [ language_section(rng, target_language, index, template_density) ]
+        for _ in range(rng.randint(0, 2)):
+            sections.insert(rng.randint(0, len(sections)),
+                language_section(rng, _pick_language(rng, languages), index, template_density))
+
+        output_file.write(ENTRY_TEMPLATE % {
+            'id': index + 1,
+            'title': word(index),
+            'pos': 'noun' if index % 3 else 'verb',
+            'rank': index + 1,
+            'revision': 1_000_000 + index,
+            'sha1': "%031x" % rng.getrandbits(124),
+            'text': "\n----\n\n".join(sections),
+        })
+    output_file.write("</dictionary>\n")
+
+
+def write_frequency_list(output_file: TextIO, pages: int, step: int = 2):
+    """
+    Write a frequency list containing every 'step'-th word of a synthetic dump.
+    """
+    for rank, index in enumerate(range(0, pages, step), start=1):
+        output_file.write("%d,%s,%s\n" % (rank, word(index), 'noun' if rank % 3 else 'verb'))
@@ -0,0 +1,59 @@
+"""
+Compare the throughput of the TTS backends on synthetic words, reporting
+words/sec per backend. The 'google' backend is only measured when requested
+explicitly, as it sends requests to the Google Cloud API.
+"""
+
+import argparse
+import contextlib
+import os
+import shutil
+import tempfile
+import time
+
+from benchmark import synthetic
+from data.card import Card, CardWriter
+from tts import synthesize_dictionary
+from tts_backends import BACKENDS
+
+
+def available_backends():
+    backends = [ 'fake' ]
+    if shutil.which("espeak-ng") and shutil.which("ffmpeg"):
+        backends.append('espeak')
+    return backends
+
+
+def measure(backend: str, json_path: str, directory: str, workers: int):
+    output_dir = os.path.join(directory, backend)
+    os.mkdir(output_dir)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        synthesize_dictionary(json_path, backend, workers, output_dir=output_dir)
+        elapsed = time.perf_counter() - start
+
+    return elapsed, sum(1 for filename in os.listdir(output_dir) if filename.endswith(".mp3"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--words', '-n', type=int, default=200,
+                    help='Number of words to synthesize.')
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=available_backends(),
+                    help='Backends to compare.')
+    parser.add_argument('--workers', '-w', type=int,
+                    help='Number of concurrent requests. Defaults to a value suited to each backend.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        json_path = os.path.join(directory, "cards.jsonl")
+        with open(json_path, "w", encoding="utf-8") as json_file:
+            writer = CardWriter(json_file)
+            for index in range(args.words):
+                writer.write(Card(synthetic.word(index), "Noun", index + 1, ["definition"]))
+
+        print("%-8s %10s %12s" % ("backend", "seconds", "words/sec"))
+        for backend in args.backends:
+            elapsed, words = measure(backend, json_path, directory, args.workers)
+            print("%-8s %10.2f %12.1f" % (backend, elapsed, words / elapsed))
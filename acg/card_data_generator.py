@@ -1,28 +1,107 @@
 #!/usr/bin/env python3
 
 import argparse
+import collections
+import functools
+import json
+import os
 import xml.sax
 import re
 import sys
 import wikitextparser as wtp
 
-from data.card import Card
-from template_processor import TemplateProcessor as tp
-from typing import List
+import metrics
+from concurrent.futures import ProcessPoolExecutor
+from data.card import MISMATCHED_POS_RANK_OFFSET, Card, CardWriter
+from page_cache import ExtractedSection, PageCache
+from page_store import PageStore, content_hash
+from parser_backends import BACKENDS, iter_records
+from template_processor import TEMPLATE_CACHE_SIZE, TemplateProcessor as tp
+from typing import List, NamedTuple, Optional, Tuple
+
+# Fields of an '<entry>' element read by the alternative parser backends
+ENTRY_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'pos': 'pos',
+    'rank': 'rank',
+    'revision': 'revision',
+    'sha1': 'sha1',
+    'text': 'text',
+}
+
+# Number of entries submitted to each worker process ahead of the output
+IN_FLIGHT_PER_JOB = 4
+
+# Line separating definitions which are converted to plain text at once
+ITEM_SEPARATOR = "\n\x1f\n"
+
+# Templates, parameters & links without nested brackets, which are removed repeatedly to check that all are closed
+BALANCED_MARKUP_PATTERN = re.compile(r"\{\{[^{}]*\}\}|\[[^\[\]]*\]")
+
+# Detect remains of templates whose definitions should be deleted completely
+MARKED_DEFINITION_PATTERN = re.compile(r"^.*\$\$[^\{\}]*\$\$.*$")
+
+class MissingSectionError(LookupError):
+    """
+    Raised for pages without a section in the target language, which are
+    skipped.
+    """
+
+class Entry(NamedTuple):
+    """
+    A word entry of the filtered dictionary, as handed to the (possibly
+    parallel) card generation.
+    """
+    id: str
+    title: str
+    pos: str
+    rank: int
+    revision: str
+    sha1: str
+    text: str
 
 class CardDataGenerator(xml.sax.ContentHandler):
 
-    def __init__(self, output_file, target_language = 'English'):
+    def __init__(self, output_file, target_language = 'English', page_store: PageStore = None, jobs: int = 1,
+            card_writer = None, page_cache: PageCache = None):
         xml.sax.ContentHandler.__init__(self)
-        self.output_file = output_file
+
+        # Anything with a 'write(card)' method may take the cards instead of the output file
+        self.card_writer = card_writer or CardWriter(output_file)
         self.target_language = target_language
 
+        # Worker processes generating the cards, fed with a bounded number of
+        # entries whose results are saved in their original order
+        self.executor = ProcessPoolExecutor(jobs, initializer=configure_caches,
+            initargs=_cache_sizes()) if jobs > 1 else None
+        self.max_in_flight = jobs * IN_FLIGHT_PER_JOB
+        self.in_flight = collections.deque()
+        self.worker_cache_info = {}
+
+        # Templates expanded by worker processes, or by this one since it was created
+        self.templates_expanded = 0
+        self.expansion_start = tp.expansion_count()
+        self.metrics = metrics.get_metrics()
+
+        # Store to save cards in instead of the output file, keeping track of changes
+        self.page_store = page_store
+        self.added_cards = []
+        self.changed_cards = []
+        self.removed_cards = []
+
+        # Cache of the sections extracted from each page, which are only extracted again if its text changed
+        self.page_cache = page_cache
+        self.cached_titles = []
+
         # Flag to determine our current position inside the XML file
         self.in_entry = False
         self.in_id = False
         self.in_title = False
         self.in_pos = False
         self.in_rank = False
+        self.in_revision = False
+        self.in_sha1 = False
         self.in_text = False
 
         # Variables to hold information about the processed element
@@ -30,91 +109,246 @@ class CardDataGenerator(xml.sax.ContentHandler):
         self.title = None
         self.pos = None
         self.rank = None
+        self.revision = None
+        self.sha1 = None
         self.text = None
 
     def startElement(self, name, attrs):
         if name == "entry":
             self.in_entry = True
+            self.revision = None
+            self.sha1 = None
         if self.in_entry and name == "id":
             self.in_id = True
+            self.id = []
         if self.in_entry and name == "title":
             self.in_title = True
+            self.title = []
         if self.in_entry and name == "pos":
             self.in_pos = True
+            self.pos = []
         if self.in_entry and name == "rank":
             self.in_rank = True
+            self.rank = []
+        if self.in_entry and name == "revision":
+            self.in_revision = True
+            self.revision = []
+        if self.in_entry and name == "sha1":
+            self.in_sha1 = True
+            self.sha1 = []
         if self.in_entry and name == "text":
             self.in_text = True
-            self.text = ""
+            self.text = []
 
     def characters(self, content):
         if self.in_title:
-            self.title = content
+            self.title.append(content)
         elif self.in_id:
-            self.id = content
+            self.id.append(content)
         elif self.in_pos:
-            self.pos = content
+            self.pos.append(content)
         elif self.in_rank:
-            self.rank = int(content)
+            self.rank.append(content)
+        elif self.in_revision:
+            self.revision.append(content)
+        elif self.in_sha1:
+            self.sha1.append(content)
         elif self.in_text:
-            self.text += content
+            self.text.append(content)
 
     def endElement(self, name):
         if name == "entry":
-            entries = self._process()
-            self._save(entries)
-        if self.in_entry and name == "title":
+            self.in_entry = False
+            self.process_entry(Entry(self.id, self.title, self.pos, self.rank, self.revision, self.sha1, self.text))
+
+        # Values may be split into several chunks, e.g. at the boundaries of the parser's buffer
+        if self.in_title and name == "title":
             self.in_title = False
-        if self.in_entry and name == "id":
+            self.title = "".join(self.title)
+        if self.in_id and name == "id":
             self.in_id = False
+            self.id = "".join(self.id)
         if self.in_pos and name == "pos":
             self.in_pos = False
+            self.pos = "".join(self.pos)
         if self.in_rank and name == "rank":
             self.in_rank = False
-        if self.in_entry and name == "text":
+            self.rank = int("".join(self.rank))
+        if self.in_revision and name == "revision":
+            self.in_revision = False
+            self.revision = "".join(self.revision)
+        if self.in_sha1 and name == "sha1":
+            self.in_sha1 = False
+            self.sha1 = "".join(self.sha1)
+        if self.in_text and name == "text":
             self.in_text = False
+            self.text = "".join(self.text)
 
-    def _process(self):
+    def process_record(self, record: dict):
+        """
+        Process an entry read by one of the alternative parser backends instead
+        of the SAX events.
+        """
+        self.process_entry(Entry(record.get('id'), record.get('title'), record.get('pos'), int(record.get('rank')),
+            record.get('revision'), record.get('sha1'), record.get('text', '')))
+
+    def process_entry(self, entry: Entry, sections: List[ExtractedSection] = None):
+        """
+        Generate the cards of an entry. Sections already extracted from it are
+        used instead of parsing its text.
+        """
+        if sections is None and self.page_cache:
+            sections = self.page_cache.get(self.target_language, entry.title, entry.text)
+        if sections is not None:
+            self.metrics.count('pages_cached')
+        if self.page_cache:
+            self.cached_titles.append(entry.title)
+
+        # All sections are extracted for the cache, such that changes to the relevant ones are served from it
+        all_sections = self.page_cache is not None
+        if self.executor is None:
+            self._save(entry, *CardDataGenerator._process(entry, self.target_language, sections, all_sections),
+                is_cached=sections is not None)
+            return
+
+        future = self.executor.submit(_process_in_worker, entry, self.target_language, sections, all_sections)
+        self.in_flight.append((entry, sections is not None, future))
+        while len(self.in_flight) >= self.max_in_flight:
+            self._save_oldest()
+
+    def _save_oldest(self):
+        entry, is_cached, future = self.in_flight.popleft()
+        cards, sections, pid, worker_cache_info, templates_expanded = future.result()
+        self.worker_cache_info[pid] = worker_cache_info
+        self.templates_expanded += templates_expanded
+        self._save(entry, cards, sections, is_cached)
+
+    def cache_info(self):
+        """
+        Return the combined hits & misses of the template and definition
+        caches of all processes, each being None if disabled.
+        """
+        if self.executor is None:
+            return _cache_info()
+
+        return tuple(
+            _add_cache_info(infos[index] for infos in self.worker_cache_info.values())
+            for index in range(2)
+        )
+
+    def finish(self, prune_cache: bool = False):
+        """
+        Wait for all entries still being processed and save their cards. Given
+        a page store, pages missing from the dump are removed and all stored
+        cards are written afterwards. If the dictionary contained all pages,
+        pages missing from it can be pruned from the page cache.
+        """
+        while self.in_flight:
+            self._save_oldest()
+        if self.executor is not None:
+            self.executor.shutdown()
+
+        if self.page_cache:
+            if prune_cache:
+                self.page_cache.retain(self.target_language, self.cached_titles)
+            self.page_cache.commit()
+
+        self.metrics.count('templates_expanded',
+            self.templates_expanded + tp.expansion_count() - self.expansion_start)
+
+        if self.page_store:
+            self.removed_cards.extend(self.page_store.remove_missing_pages())
+            for card in self.page_store.cards():
+                self.card_writer.write(card)
+                self.metrics.count('cards_emitted')
+
+    def print_summary(self, diff_filename: str = None):
+        """
+        Report the use of the caches and, given a page store, the changes since
+        the last run, optionally writing them to a diff file.
+        """
+        template_info, definition_info = self.cache_info()
+        _print_cache_info("Template", template_info)
+        _print_cache_info("Definition", definition_info)
+
+        if self.page_store:
+            added, changed, removed = self.added_cards, self.changed_cards, self.removed_cards
+            print("Added %d, changed %d and removed %d cards" % (len(added), len(changed), len(removed)))
+            if diff_filename:
+                _save_diff(diff_filename, added, changed, removed)
+
+    @staticmethod
+    def _process(entry: Entry, target_language: str, sections: List[ExtractedSection] = None,
+            all_sections: bool = False) -> Tuple[List[Card], Optional[List[ExtractedSection]]]:
         """
         Process a Wiktionary page resulting in one or many (flash) "Card"
         objects containing the definitions for each word and its
-        corresponding part-of-speech.
+        corresponding part-of-speech. Unless given, the sections are extracted
+        from the text of the page and returned alongside the cards, either
+        all of them or only the relevant ones.
         """
-        parsed_page = wtp.parse(self.text)
-
-        # Only use contents of target language
-        subsections = CardDataGenerator._extract_target_lang_sections(parsed_page, self.target_language)
+        extracted_sections = None
+        if sections is None:
+            # Only use contents of target language
+            try:
+                sections = extracted_sections = CardDataGenerator._extract_sections(entry.text, target_language,
+                    all_sections)
+            except MissingSectionError as error:
+                print("Skipping %s: %s" % (entry.title, error), file=sys.stderr)
+                return [], []
 
         # Relevant subsections containing translations
-        relevant_sections = CardDataGenerator._filter_pos_sections(subsections)
+        relevant_sections = CardDataGenerator._filter_pos_sections(sections)
 
-        # Extract & format definitions
-        cards = CardDataGenerator._generate_cards(self.title, self.pos, self.rank, relevant_sections)
+        # Format definitions
+        cards = CardDataGenerator._generate_cards(entry.title, entry.pos, entry.rank, relevant_sections,
+            target_language)
 
-        return cards
+        return cards, extracted_sections
+
+    @staticmethod
+    def _extract_sections(text: str, target_language: str, all_sections: bool = False) -> List[ExtractedSection]:
+        """
+        Parse a page and extract the plain text definition list items of the
+        subsections of its target language section, either of all of them or
+        only of the relevant ones.
+        """
+        subsections = CardDataGenerator._extract_target_lang_sections(wtp.parse(text), target_language)
+        if not all_sections:
+            subsections = CardDataGenerator._filter_pos_sections(subsections)
+
+        return [
+            ExtractedSection(section.title, [
+                item.strip()
+                for item in CardDataGenerator._plain_text_items(
+                    [ def_item for def_list in section.get_lists() for def_item in def_list.items ])
+            ])
+            for section in subsections
+        ]
 
     @staticmethod
     def _extract_target_lang_sections(parsed_page: wtp.WikiText, target_language: str) -> List[wtp.Section]:
         """
         Extract only the main section in the specified target language and
         retrieve subsections potentially containing words alongside their
-        definitions.
+        definitions. The subsections share the spans of the parsed page, such
+        that nothing is parsed again.
         """
-        target_lang_section = [
-            section.contents
-            for section in parsed_page.sections
-            if section.title == target_language
-        ][0]
+        target_lang_section = next(
+            (section for section in parsed_page.sections if section.title == target_language),
+            None)
+        if target_lang_section is None:
+            raise MissingSectionError("no %s section" % target_language)
 
-        return wtp.parse(target_lang_section).get_sections(include_subsections=False, level=3) \
-                + wtp.parse(target_lang_section).get_sections(include_subsections=False, level=4)
+        return target_lang_section.get_sections(include_subsections=False, level=3) \
+                + target_lang_section.get_sections(include_subsections=False, level=4)
 
     @staticmethod
     def _filter_pos_sections(subsections: List[wtp.Section]) -> List[wtp.Section]:
         """
         Filter out sections not containing relevant definitions. Relevant
         sections are distinguished by having names corresponding to
-        parts-of-speech.
+        parts-of-speech. Extracted sections are filtered alike.
         """
         RELEVANT_SECTIONS = tuple(['Adjective', 'Adverb', 'Conjunction', 'Determiner', 'Interjection', 'Noun',
             'Number', 'Numeral', 'Ordinal number', 'Particle', 'Postposition', 'Preposition', 'Pronoun', 'Verb'])
@@ -134,49 +368,206 @@ class CardDataGenerator(xml.sax.ContentHandler):
             .replace(')', ')</span>')
 
     @staticmethod
-    def _generate_cards(src_word: str, pos: str, word_rank: int, subsections: List[wtp.Section]) -> List[Card]:
+    def _is_self_contained(item: str) -> bool:
         """
-        Extract relevant definitions from a part-of-speech section and format
-        them appropriately for further processing.
+        Check whether all markup of a list item is closed within it, such that
+        it cannot affect the items around it when they are parsed together.
+        Items containing tags, comments or the separator of joined items are
+        never considered self-contained.
         """
-        # Detect remains of templates whose definitions should be deleted completely
-        p = re.compile(r"^.*\$\$[^\{\}]*\$\$.*$")
-        entries = []
+        if "<" in item or "\x1f" in item:
+            return False
 
-        for pos_section in subsections:
-            # Retrieve all definitions from the section
-            items = [ wtp.WikiText(def_item) for def_list in pos_section.get_lists() for def_item in def_list.items ]
+        removed = 1
+        while removed:
+            item, removed = BALANCED_MARKUP_PATTERN.subn("", item)
+        return not any(bracket in item for bracket in "{}[]")
+
+    @staticmethod
+    def _plain_text_items(items: List[str]) -> List[str]:
+        """
+        Format list items as plain text. Self-contained items are parsed all at
+        once, while items whose markup might span several of them, e.g. an
+        unclosed tag or table, are parsed separately.
+        """
+        plain_items = [ None ] * len(items)
+
+        joined = [ index for index, item in enumerate(items) if CardDataGenerator._is_self_contained(item) ]
+        if joined:
+            joined_items = wtp.parse(ITEM_SEPARATOR.join(items[index] for index in joined)) \
+                .plain_text(replace_templates=False).split(ITEM_SEPARATOR)
+            if len(joined_items) == len(joined):
+                for index, plain_item in zip(joined, joined_items):
+                    plain_items[index] = plain_item
+
+        return [
+            plain_item if plain_item is not None else wtp.WikiText(item).plain_text(replace_templates=False)
+            for item, plain_item in zip(items, plain_items)
+        ]
+
+    @staticmethod
+    def _finalize_definition(formatted_item: str):
+        """
+        Evaluate the templates of a definition and style it, or return None if
+        the whole definition should be dropped.
+        """
+        processed_item = tp.process_templates(formatted_item)
 
-            # Format definition as plain text
-            formatted_items = [ item.plain_text(replace_templates=False).strip() for item in items ]
+        # Clean up unwanted definitions
+        if MARKED_DEFINITION_PATTERN.match(processed_item):
+            return None
 
-            # Evaluate template expressions
-            processed_items = [ tp.process_templates(formatted_item) for formatted_item in formatted_items ]
+        # Allow for differentiated styling of remarks in parentheses for readability
+        return CardDataGenerator._add_parenthesed_styling(processed_item.strip())
+
+    @staticmethod
+    def _generate_cards(src_word: str, pos: str, word_rank: int, subsections: List[ExtractedSection],
+            language: str = Card.DEFAULT_LANGUAGE) -> List[Card]:
+        """
+        Finalize the definitions extracted from the part-of-speech sections
+        for further processing.
+        """
+        entries = []
 
-            # Clean up unwanted definitions
-            cleaned_items = [ processed_item.strip() for processed_item in processed_items if not p.match(processed_item)]
+        for pos_section in subsections:
+            formatted_items = pos_section.items
 
-            # Allow for differentiated styling of remarks in parentheses for readability
-            finalized_items = [ CardDataGenerator._add_parenthesed_styling(cleaned_item) for cleaned_item in cleaned_items ]
+            # Evaluate template expressions, clean up unwanted definitions & style them
+            finalized_items = [
+                finalized_item
+                for finalized_item in map(_finalize_definition, formatted_items)
+                if finalized_item is not None
+            ]
 
             # Generate Card
-            true_rank = word_rank if pos_section.title.lower() == pos.lower() else 1_000_000 + word_rank
-            entries.append(Card(src_word, pos_section.title, true_rank, finalized_items))
+            true_rank = word_rank
+            if pos_section.title.lower() != pos.lower():
+                true_rank += MISMATCHED_POS_RANK_OFFSET
+            entries.append(Card(src_word, pos_section.title, true_rank, finalized_items, language))
 
         return entries
 
-    def _save(self, entries: List[Card]):
+    def _save(self, entry: Entry, entries: List[Card], sections: List[ExtractedSection] = None,
+            is_cached: bool = False):
+        self.metrics.count('pages_processed')
+        if self.page_cache and not is_cached and sections is not None:
+            self.page_cache.put(self.target_language, entry.title, entry.id, entry.pos, entry.rank, entry.text,
+                sections)
+        elif self.page_cache and is_cached:
+            # The rank & part of speech may change without the text, e.g. with a new frequency list
+            self.page_cache.update_entry(self.target_language, entry.title, entry.id, entry.pos, entry.rank)
+        if self.page_store:
+            page_hash = content_hash(entry.sha1, entry.rank, entry.pos)
+            cards = [ card for card in entries if card.definitions ]
+            added, changed, removed = self.page_store.update_page(entry.id, entry.title, entry.revision, page_hash,
+                cards)
+            self.added_cards.extend(added)
+            self.changed_cards.extend(changed)
+            self.removed_cards.extend(removed)
+            return
+
         for entry in entries:
             if entry.definitions:
-                self.output_file.write(str(entry) + ',\n')
-
-
-def generate_card_data(dictionary_filename, output_filename, target_language):
-    with open(dictionary_filename, "r", encoding="utf-8") as dic_file:
-        with open(output_filename, "w", encoding="utf-8") as output_file:
-            output_file.write("[\n")
-            xml.sax.parse(dic_file, CardDataGenerator(output_file, target_language))
-            output_file.write("]\n")
+                self.card_writer.write(entry)
+                self.metrics.count('cards_emitted')
+
+
+def configure_caches(template_cache_size: int, definition_cache_size: int):
+    """
+    Set up the caches of expanded templates and of whole finalized definitions
+    of the current process. A size of 0 disables the respective cache.
+    """
+    global _finalize_definition
+    tp.configure_cache(template_cache_size)
+    if definition_cache_size > 0:
+        _finalize_definition = functools.lru_cache(definition_cache_size)(CardDataGenerator._finalize_definition)
+    else:
+        _finalize_definition = CardDataGenerator._finalize_definition
+
+# Finalization of definitions used by '_generate_cards', replaced by a cached version by 'configure_caches'
+_finalize_definition = CardDataGenerator._finalize_definition
+
+class CacheStats(NamedTuple):
+    """
+    Picklable counterpart of the statistics returned by 'lru_cache', such that
+    they can be sent back from worker processes.
+    """
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+def _cache_info():
+    template_info = tp.cache_info()
+    definition_info = _finalize_definition.cache_info() if hasattr(_finalize_definition, 'cache_info') else None
+    return tuple(CacheStats(*info) if info else None for info in (template_info, definition_info))
+
+def _cache_sizes():
+    return tuple(info.maxsize if info else 0 for info in _cache_info())
+
+def _add_cache_info(infos):
+    infos = [ info for info in infos if info is not None ]
+    if not infos:
+        return None
+    return infos[0]._replace(
+        hits=sum(info.hits for info in infos),
+        misses=sum(info.misses for info in infos),
+        currsize=sum(info.currsize for info in infos))
+
+def _process_in_worker(entry: Entry, target_language: str, sections: List[ExtractedSection],
+        all_sections: bool):
+    """
+    Generate the cards of an entry in a worker process, also returning the
+    sections extracted, the state of its caches and the number of templates
+    expanded.
+    """
+    expansion_start = tp.expansion_count()
+    return (*CardDataGenerator._process(entry, target_language, sections, all_sections), os.getpid(),
+        _cache_info(), tp.expansion_count() - expansion_start)
+
+def _print_cache_info(name: str, info):
+    if info is None:
+        print("%s cache: disabled" % name)
+        return
+
+    lookups = info.hits + info.misses
+    print("%s cache: %d hits, %d misses (%.1f%% hit rate), %d entries" % (name, info.hits, info.misses,
+        100 * info.hits / lookups if lookups else 0, info.currsize))
+
+def _save_diff(diff_filename: str, added: List[Card], changed: List[Card], removed: List[Card]):
+    with open(diff_filename, "w", encoding="utf-8") as diff_file:
+        json.dump({
+            'added': [ card.to_json() for card in added ],
+            'changed': [ card.to_json() for card in changed ],
+            'removed': [ card.to_json() for card in removed ],
+        }, diff_file, indent=4)
+
+def generate_card_data(dictionary_filename, output_filename, target_language, backend='sax',
+        page_store: PageStore = None, diff_filename: str = None, jobs: int = 1, page_cache: PageCache = None):
+    """
+    Generate the card data of all entries in the dictionary. Given a page
+    store, the dictionary only needs to contain pages which changed since the
+    last run. The output then contains all stored cards and the changes are
+    optionally written to a diff file. Given a page cache, sections are only
+    extracted from pages whose text changed since they were cached. Without
+    a dictionary, the cards are generated from the cached pages alone.
+    """
+    with open(output_filename, "w", encoding="utf-8") as output_file, metrics.get_metrics().stage('cards'):
+        card_data_generator = CardDataGenerator(output_file, target_language, page_store, jobs,
+            page_cache=page_cache)
+        if dictionary_filename is None:
+            for page_id, title, pos, rank, sections in page_cache.pages(target_language):
+                card_data_generator.process_entry(Entry(page_id, title, pos, rank, None, None, None), sections)
+        else:
+            with open(dictionary_filename, "rb") as dic_file:
+                if backend == 'sax':
+                    xml.sax.parse(dic_file, card_data_generator)
+                else:
+                    for record in iter_records(dic_file, 'entry', ENTRY_FIELDS, backend=backend):
+                        card_data_generator.process_record(record)
+        card_data_generator.finish(prune_cache=dictionary_filename is not None and page_store is None)
+
+    card_data_generator.print_summary(diff_filename)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Filter word entries from a Wiktionary dump by language.')
@@ -189,10 +580,49 @@ if __name__ == "__main__":
                     default='filtered_dictionary.xml',
                     help='Filtered excerpt of Wiktionary dump.')
     parser.add_argument('--output-file', '-o', type=str,
-                    default='card_data.json',
+                    default='card_data.jsonl',
                     help='Processed entry data containing definitions & further information about words in\
-                    JSON format.')
+                    JSON Lines format.')
+    parser.add_argument('--parser-backend', '-b', type=str,
+                    choices=BACKENDS, default='sax',
+                    help='XML parser used to read the dictionary. The "lxml" backend requires lxml to be installed.')
+    parser.add_argument('--page-store', '-s', type=str,
+                    help='SQLite database of pages processed in earlier runs, shared with the language filter. '
+                        + 'Cards of unchanged pages are taken from it.')
+    parser.add_argument('--diff-file', type=str,
+                    help='JSON file to write the cards added, changed or removed since the last run to.')
+    parser.add_argument('--page-cache', '-c', type=str,
+                    help='SQLite database caching the sections extracted from each page, which are only extracted '
+                        + 'again if the text of the page changed.')
+    parser.add_argument('--from-page-cache', action='store_true',
+                    help='Generate the cards from the pages in the page cache without reading the dictionary, e.g. '
+                        + 'after changing the template rules.')
+    parser.add_argument('--jobs', '-j', type=int,
+                    default=1,
+                    help='Number of worker processes generating cards in parallel.')
+    parser.add_argument('--template-cache-size', type=int,
+                    default=TEMPLATE_CACHE_SIZE,
+                    help='Number of distinct expanded templates to cache per process. Use 0 to disable the cache.')
+    parser.add_argument('--definition-cache-size', type=int,
+                    default=0,
+                    help='Number of distinct finalized definitions to cache per process. Disabled by default.')
+    metrics.add_arguments(parser)
     args = parser.parse_args()
 
-    # Read & filter the Wiktionary dump
-    generate_card_data(args.dictionary_file, args.output_file, args.target_language)
+    if args.from_page_cache and not args.page_cache:
+        parser.error('--from-page-cache requires --page-cache')
+    if args.from_page_cache and args.page_store:
+        parser.error('--from-page-cache cannot be combined with --page-store')
+
+    configure_caches(args.template_cache_size, args.definition_cache_size)
+
+    with metrics.run('card_data_generator', args):
+        # Read & filter the Wiktionary dump
+        page_store = PageStore(args.page_store) if args.page_store else None
+        page_cache = PageCache(args.page_cache) if args.page_cache else None
+        generate_card_data(None if args.from_page_cache else args.dictionary_file, args.output_file,
+            args.target_language, args.parser_backend, page_store, args.diff_file, args.jobs, page_cache)
+        if page_store:
+            page_store.close()
+        if page_cache:
+            page_cache.close()
@@ -1,39 +1,149 @@
 #!/usr/bin/env python3
 
 import argparse
+import contextlib
 import glob
-import json
 import os
 import shutil
 import sys
 
+import metrics
 from anki.decks import Deck
+from anki.models import NoteType
 from anki.notes import Note
 from anki.storage import Collection
-from data.card import Card
+from data.card import read_cards, select_cards
+from data.rendering import DEFAULT_RENDERER, DEFINITION_RATIO, FIELD_NAMES, MAX_DEFINITIONS, CardRenderer
+from typing import Dict, Optional, Tuple
 
 
-def fill(collection: Collection, deck: Deck, json_path: str):
+@contextlib.contextmanager
+def _transaction(collection: Collection, name: str):
     """
-    Parse and fill the contents of the JSON document containing the card data
-    into the collection.
+    Run the changes to the collection within a single savepoint, which is
+    rolled back as a whole on failure. The savepoint nests within the
+    transaction Anki keeps open, which is only committed by 'Collection.save',
+    or is a transaction of its own without one.
+    """
+    collection.db.execute("SAVEPOINT %s" % name)
+    try:
+        yield
+    except BaseException:
+        collection.db.execute("ROLLBACK TO %s" % name)
+        collection.db.execute("RELEASE %s" % name)
+        raise
+    collection.db.execute("RELEASE %s" % name)
+
+
+def fill(collection: Collection, deck: Deck, json_path: str, model: NoteType = None,
+        min_rank: Optional[int] = None, max_rank: Optional[int] = None, top_n: Optional[int] = None,
+        renderer: CardRenderer = DEFAULT_RENDERER):
+    """
+    Parse and fill the contents of the JSON Lines document containing the card
+    data into the collection.
+
+    Notes are built using the given model, which is only resolved once. Anki
+    2.1.34 offers no API to add several notes at once, so each note is still
+    added by its own 'add_note' call, but all of them within one explicit
+    transaction: either all notes are added or none. Only cards within the
+    given rank range are added, optionally limited to the 'top_n' most
+    frequent ones.
+
+    :param json_path: the file path of the JSON Lines document file
+    """
+    model = model or collection.models.current()
+    deck_id = deck['id']
+    cards = select_cards(read_cards(json_path), min_rank, max_rank, top_n)
+    run_metrics = metrics.get_metrics()
+
+    added = 0
+    with run_metrics.stage('import'), _transaction(collection, 'fill'):
+        for card in cards:
+            collection.add_note(renderer.fill_into_note(card, Note(collection, model)), deck_id)
+            added += 1
+            run_metrics.count('notes_added')
+
+    return added
+
+
+def _occurrence_key(occurrences: Dict[Tuple[str, str], int], word: str, pos: str) -> Tuple[str, str, int]:
+    """
+    Tell apart notes or cards sharing their word and part-of-speech, e.g. of
+    several etymologies, by the number of such earlier ones.
+    """
+    key = (word, pos)
+    occurrence = occurrences.get(key, 0)
+    occurrences[key] = occurrence + 1
+    return key + (occurrence,)
+
+
+def _existing_notes(collection: Collection, deck: Deck) -> Dict[Tuple[str, str, int], Note]:
+    """
+    Index the notes of a deck by their word, part-of-speech and occurrence in
+    the order they were added.
+    """
+    occurrences = {}
+    return {
+        _occurrence_key(occurrences, note['Front'], note['PartOfSpeech']): note
+        for note in map(collection.getNote, sorted(collection.find_notes("did:%d" % deck['id'])))
+    }
+
 
-    :param json_path: the file path of the JSON document file
+def sync(collection: Collection, deck: Deck, json_path: str, model: NoteType = None,
+        suspend_missing: bool = False, min_rank: Optional[int] = None, max_rank: Optional[int] = None,
+        top_n: Optional[int] = None, renderer: CardRenderer = DEFAULT_RENDERER):
     """
-    with open(json_path, 'r') as f:
-        json_content = f.read()
-        doc = json.loads(json_content)
-        cards = [ Card.from_json(json_obj) for json_obj in list(doc) ]
-
-        for card in sorted(cards, key=lambda card: card.rank):
-            if card.has_definitions():
-                empty_note = collection.newNote()
-                empty_note.model()['did'] = deck['id']
-                filled_note = card.fill_into_note(empty_note)
-
-                collection.add_note(filled_note, deck['id'])
+    Synchronize the deck with the contents of the JSON Lines document
+    containing the card data. Notes are matched by their word and
+    part-of-speech, such that only new notes are added and only notes whose
+    fields changed are updated, keeping the review history intact. Several
+    cards of the same word and part-of-speech, e.g. of several etymologies,
+    are matched to such notes in the order they were added. Notes without a
+    corresponding card among the selected ones, including further notes of the
+    same word and part-of-speech, are optionally suspended and otherwise
+    counted. All changes are made within one explicit transaction.
+
+    :param json_path: the file path of the JSON Lines document file
+    """
+    model = model or collection.models.current()
+    deck_id = deck['id']
+    existing_notes = _existing_notes(collection, deck)
+    occurrences = {}
+    run_metrics = metrics.get_metrics()
+    added, updated, unchanged = 0, 0, 0
+
+    with run_metrics.stage('import'), _transaction(collection, 'sync'):
+        for card in select_cards(read_cards(json_path), min_rank, max_rank, top_n):
+            fields = dict(zip(FIELD_NAMES, renderer.render(card)))
+            key = _occurrence_key(occurrences, fields['Front'], fields['PartOfSpeech'])
+
+            note = existing_notes.pop(key, None)
+            if note is None:
+                note = Note(collection, model)
+                for name, value in fields.items():
+                    note[name] = value
+                collection.add_note(note, deck_id)
+                added += 1
+                run_metrics.count('notes_added')
+            elif any(note[name] != value for name, value in fields.items()):
+                for name, value in fields.items():
+                    note[name] = value
+                note.flush()
+                updated += 1
+                run_metrics.count('notes_updated')
             else:
-                continue
+                unchanged += 1
+                run_metrics.count('notes_unchanged')
+
+        suspended = 0
+        if suspend_missing and existing_notes:
+            card_ids = [ card.id for note in existing_notes.values() for card in note.cards() ]
+            collection.sched.suspendCards(card_ids)
+            suspended = len(existing_notes)
+            run_metrics.count('notes_suspended', suspended)
+
+    print("Added %d, updated %d, kept %d unchanged and suspended %d notes, %d notes without a card" % (added,
+        updated, unchanged, suspended, len(existing_notes) - suspended))
 
 
 if __name__ == '__main__':
@@ -46,12 +156,29 @@ if __name__ == '__main__':
     parser.add_argument("-d", "--deck-name", default="Default",
         help="Name of the card deck into which to add cards")
     parser.add_argument("-j", "--json-file",
-        help="JSON file containing data with which to create cards")
+        help="JSON Lines file containing data with which to create cards")
     parser.add_argument("-m", "--model-name",
         help="Name of the note type (model) to be used for new cards")
     parser.add_argument("-p", "--anki-profile", default="User 1",
         help="Name of the profile for which the collection should be created")
+    parser.add_argument("-s", "--sync", action="store_true",
+        help="Update existing notes of the deck matching a card's word and part-of-speech instead of adding "\
+            + "duplicates, leaving unchanged notes untouched")
+    parser.add_argument("--suspend-missing", action="store_true",
+        help="When synchronizing, suspend notes of the deck without a corresponding card")
+    parser.add_argument("--min-rank", type=int,
+        help="Skip cards of words ranked before this rank in the frequency list, whatever their part of speech")
+    parser.add_argument("--max-rank", type=int,
+        help="Skip cards of words ranked after this rank in the frequency list, whatever their part of speech")
+    parser.add_argument("-n", "--top-n", type=int,
+        help="Only use this many cards of the most frequent words within the rank range")
+    parser.add_argument("--max-definitions", type=int, default=MAX_DEFINITIONS,
+        help="Maximum number of definitions shown per card")
+    parser.add_argument("--definition-ratio", type=float, default=DEFINITION_RATIO,
+        help="Share of a card's definitions shown, limited by --max-definitions")
+    metrics.add_arguments(parser)
     args = parser.parse_args()
+    renderer = CardRenderer(args.max_definitions, args.definition_ratio)
 
     # Load the anki collection
     collection_path = os.path.join(args.anki_home, args.anki_profile, "collection.anki2")
@@ -64,9 +191,14 @@ if __name__ == '__main__':
     collection.decks.select(deck['id'])
     collection.decks.current()['mid'] = model['id']
 
-    # Load JSON into collection
-    fill(collection, deck, json_file)
+    with metrics.run('card_generator', args):
+        # Load JSON into collection
+        if args.sync:
+            sync(collection, deck, json_file, model, args.suspend_missing, args.min_rank, args.max_rank, args.top_n,
+                renderer)
+        else:
+            fill(collection, deck, json_file, model, args.min_rank, args.max_rank, args.top_n, renderer)
 
-    # Save the changes to DB
-    collection.save()
-    collection.close()
+        # Save the changes to DB
+        collection.save()
+        collection.close()
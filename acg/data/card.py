@@ -1,57 +1,173 @@
+import heapq
+import itertools
 import json
+import operator
+import re
 
-from anki.notes import Note
-from typing import List, Final
+from data.rendering import DEFAULT_RENDERER, render_definitions
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Final, Optional, TextIO
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Only needed for type hints, such that cards can be handled without Anki
+if TYPE_CHECKING:
+    from anki.notes import Note
+
+# Added to the rank of cards whose part of speech differs from the one given by the frequency list, such that they
+# are ordered after all others
+MISMATCHED_POS_RANK_OFFSET: Final = 1_000_000
 
 class Card():
 
-    WIKI_LINK_TEMPLATE: Final = "https://en.wiktionary.org/wiki/%s#Finnish"
+    # Avoid a dictionary per card, as whole dictionaries of cards are kept in memory
+    __slots__ = ('word', 'pos', 'rank', 'definitions', 'language')
+
+    # Link to the section of the card's language on the word's Wiktionary page
+    WIKI_LINK_TEMPLATE: Final = "https://en.wiktionary.org/wiki/%(word)s#%(language)s"
+
+    # Language of cards whose data does not name one
+    DEFAULT_LANGUAGE: Final = "Finnish"
 
-    def __init__(self, word: str, pos: str, rank: int, definitions: List[str]):
+    def __init__(self, word: str, pos: str, rank: int, definitions: List[str], language: str = DEFAULT_LANGUAGE):
         self.word = word
         self.pos = pos
         self.rank = rank
         self.definitions = definitions
+        self.language = language
 
-    def fill_into_note(self, note: Note):
-        note['Front'] = self.word
-        note['PartOfSpeech'] = self.pos
-        note['Back'] = Card.parsed_definitions(self.get_first_few_definitions())
-        note['Rank'] = str(self.rank)
-        note['WikiLink'] = Card.WIKI_LINK_TEMPLATE % self.word
-        note['Audio'] = "[sound:%s.mp3]" % self.word
-        return note
+    def fill_into_note(self, note: 'Note'):
+        return DEFAULT_RENDERER.fill_into_note(self, note)
+
+    @property
+    def frequency_rank(self) -> int:
+        """
+        Rank of the word in the frequency list, without the offset of cards of
+        another part of speech.
+        """
+        return self.rank % MISMATCHED_POS_RANK_OFFSET
 
     def has_definitions(self):
         return any(definition for definition in self.definitions)
 
     @staticmethod
     def parsed_definitions(definitions: List[str]):
-        parsed_string = "<ol>\n"
-
-        for definition in definitions:
-            if len(definition) > 0:
-                parsed_string += "<li>%s</li>\n" % definition
-
-        parsed_string += "</ol>"
-        return parsed_string
+        return render_definitions(definitions)
 
     def get_first_few_definitions(self):
         """
         Selects a limited number of definitions to avoid information overload.
         """
-        count = len(self.definitions)
-        max_count = min(3, int(count / 2))
-        return self.definitions[:max_count]
+        return DEFAULT_RENDERER.select_definitions(self.definitions)
 
     @staticmethod
     def from_json(json_obj: dict):
-        word = json_obj['word']
-        pos = json_obj['pos']
-        rank = json_obj['rank']
-        definitions = json_obj['definitions']
+        return Card(json_obj['word'], json_obj['pos'], json_obj['rank'], json_obj['definitions'],
+            json_obj.get('language', Card.DEFAULT_LANGUAGE))
+
+    @staticmethod
+    def loads(data):
+        """
+        Create a card from its compact JSON representation written by 'dumps'.
+        """
+        return Card.from_json(loads(data))
 
-        return Card(word, pos, rank, definitions)
+    def to_json(self) -> dict:
+        json_obj = {
+            'word': self.word,
+            'pos': self.pos,
+            'rank': self.rank,
+            'definitions': self.definitions,
+        }
+        # Left out for the default language, such that existing card data and stored cards remain unchanged
+        if self.language != Card.DEFAULT_LANGUAGE:
+            json_obj['language'] = self.language
+        return json_obj
+
+    def dumps(self) -> str:
+        """
+        Serialize the card as a single line of compact JSON.
+        """
+        return dumps(self.to_json())
 
     def __repr__(self):
-        return json.dumps(self.__dict__, separators=(',', ': '), indent=4)
\ No newline at end of file
+        return json.dumps(self.to_json(), separators=(',', ': '), indent=4)
+
+
+# Compact JSON (de)serialization, using orjson if installed
+if orjson is not None:
+    def dumps(obj) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+
+    loads = orjson.loads
+else:
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    loads = json.loads
+
+
+# Trailing comma after the last card of card data files in the former JSON array format
+_TRAILING_COMMA = re.compile(r",\s*\]\s*$")
+
+
+class CardWriter():
+    """
+    Writes cards as JSON Lines (JSONL), i.e. one compact JSON object per line,
+    such that they can be streamed by 'read_cards'.
+    """
+
+    def __init__(self, output_file: TextIO):
+        self.output_file = output_file
+
+    def write(self, card: Card):
+        self.output_file.write(card.dumps())
+        self.output_file.write("\n")
+
+
+def read_cards(path: str) -> Iterator[Card]:
+    """
+    Lazily read the cards of a card data file in JSON Lines format. Files in
+    the former JSON array format are still supported, but read as a whole.
+    """
+    with open(path, "r", encoding="utf-8") as card_file:
+        first_line = card_file.readline()
+
+        if first_line.lstrip().startswith("["):
+            doc = loads(_TRAILING_COMMA.sub("]", first_line + card_file.read()))
+            yield from (Card.from_json(json_obj) for json_obj in doc)
+            return
+
+        for line in itertools.chain([first_line], card_file):
+            if line.strip():
+                yield Card.loads(line)
+
+
+_rank = operator.attrgetter('rank')
+
+
+def select_cards(cards: Iterable[Card], min_rank: Optional[int] = None, max_rank: Optional[int] = None,
+        top_n: Optional[int] = None, ordered: bool = True) -> Iterator[Card]:
+    """
+    Select the cards with definitions whose word's rank in the frequency list
+    lies within the given range, in the order of their rank, i.e. cards of
+    another part of speech than given by the frequency list come last. If
+    'top_n' is given, only that many cards with the lowest ranks are kept in a
+    heap while streaming through the cards, such that memory is bounded by
+    'top_n' instead of the number of cards. Without 'top_n', the order is only
+    established if 'ordered' is set.
+    """
+    selected = (
+        card
+        for card in cards
+        if card.has_definitions()
+            and (min_rank is None or card.frequency_rank >= min_rank)
+            and (max_rank is None or card.frequency_rank <= max_rank)
+    )
+
+    if top_n is not None:
+        return iter(heapq.nsmallest(top_n, selected, key=_rank))
+    elif ordered:
+        return iter(sorted(selected, key=_rank))
+    else:
+        return selected
@@ -0,0 +1,109 @@
+"""
+Rendering of cards into the fields of their notes, shared by the Anki importer
+and the package exporter. Cards are rendered into tuples of field values in
+the order of 'FIELD_NAMES', optionally a whole batch at once.
+"""
+
+from typing import TYPE_CHECKING, Iterable, List, Tuple
+
+# Only needed for type hints at import time, as 'data.card' imports this module
+if TYPE_CHECKING:
+    from data.card import Card
+
+# Fields of the note type in the order of the rendered values
+FIELD_NAMES = ('Front', 'PartOfSpeech', 'Back', 'Rank', 'WikiLink', 'Audio')
+
+# Precompiled parts of the HTML of the 'Back' field, whose list items are joined at once
+DEFINITION_LIST_START = "<ol>\n<li>"
+DEFINITION_LIST_SEPARATOR = "</li>\n<li>"
+DEFINITION_LIST_END = "</li>\n</ol>"
+EMPTY_DEFINITION_LIST = "<ol>\n</ol>"
+
+AUDIO_TEMPLATE = "[sound:%s.mp3]"
+
+# Default limits of the definitions shown per card, avoiding information overload
+MAX_DEFINITIONS = 3
+DEFINITION_RATIO = 0.5
+
+
+def render_definitions(definitions: List[str]) -> str:
+    """
+    Render the non-empty definitions as an ordered HTML list.
+    """
+    if "" in definitions:
+        definitions = [ definition for definition in definitions if definition ]
+    if not definitions:
+        return EMPTY_DEFINITION_LIST
+    return DEFINITION_LIST_START + DEFINITION_LIST_SEPARATOR.join(definitions) + DEFINITION_LIST_END
+
+
+class CardRenderer():
+    """
+    Renders cards into the values of their note's fields, showing the first
+    few definitions of each card: a 'definition_ratio' share of them, but at
+    most 'max_definitions'.
+    """
+
+    def __init__(self, max_definitions: int = MAX_DEFINITIONS, definition_ratio: float = DEFINITION_RATIO):
+        self.max_definitions = max_definitions
+        self.definition_ratio = definition_ratio
+
+        # Wiktionary link templates per language, only needing the word to be filled in
+        self.link_templates = {}
+
+    def select_definitions(self, definitions: List[str]) -> List[str]:
+        return definitions[:min(self.max_definitions, int(len(definitions) * self.definition_ratio))]
+
+    def wiki_link(self, card: 'Card') -> str:
+        """
+        Link the entry of the card's word in its language on Wiktionary.
+        """
+        link_template = self.link_templates.get(card.language)
+        if link_template is None:
+            from data.card import Card
+
+            link_template = self.link_templates[card.language] = Card.WIKI_LINK_TEMPLATE % {
+                'word': "%s",
+                'language': card.language.replace(" ", "_").replace("%", "%%"),
+            }
+        return link_template % card.word
+
+    def render(self, card: 'Card') -> Tuple[str, ...]:
+        return (
+            card.word,
+            card.pos,
+            render_definitions(self.select_definitions(card.definitions)),
+            str(card.rank),
+            self.wiki_link(card),
+            AUDIO_TEMPLATE % card.word,
+        )
+
+    def render_batch(self, cards: Iterable['Card']) -> List[Tuple[str, ...]]:
+        """
+        Render all cards at once, looking up the methods of the renderer only
+        once.
+        """
+        select_definitions, wiki_link = self.select_definitions, self.wiki_link
+        return [
+            (
+                card.word,
+                card.pos,
+                render_definitions(select_definitions(card.definitions)),
+                str(card.rank),
+                wiki_link(card),
+                AUDIO_TEMPLATE % card.word,
+            )
+            for card in cards
+        ]
+
+    def fill_into_note(self, card: 'Card', note):
+        """
+        Fill the rendered fields of the card into a note, or anything else
+        supporting item assignment by field name.
+        """
+        for name, value in zip(FIELD_NAMES, self.render(card)):
+            note[name] = value
+        return note
+
+
+DEFAULT_RENDERER = CardRenderer()
@@ -0,0 +1,133 @@
+"""
+Compact lookup structure for word frequency lists with millions of rows,
+mapping each word to its rank and part of speech.
+"""
+
+import csv
+
+from array import array
+from typing import Optional, Tuple
+
+# Number of words joined into one string at once while loading
+JOIN_SIZE = 65536
+
+# Marker of unused slots of the hash table
+_EMPTY = -1
+
+
+class FrequencyList():
+    """
+    Read-only mapping of words to (rank, part of speech) tuples, behaving like
+    the dictionary it replaces. Instead of a string, tuple and integer object
+    per word, all words are concatenated into a single string, ranks and
+    parts of speech are kept in arrays and words are found through an
+    open-addressing hash table of indices into these arrays.
+
+    The hash table depends on the hash seed of the process and is therefore
+    not pickled, but rebuilt when unpickled, e.g. by worker processes.
+    """
+
+    def __init__(self):
+        self.words = ""
+        self.offsets = array('q', [0])
+        self.ranks = array('q')
+        self.pos_codes = array('H')
+        self.pos_names = []
+        self._build_table()
+
+    @staticmethod
+    def from_csv(frequency_file: str) -> 'FrequencyList':
+        """
+        Stream a CSV file of 'rank,word,part of speech' rows. Later rows of
+        the same word take precedence, as with a dictionary.
+        """
+        frequency_list = FrequencyList()
+        pos_index = {}
+        chunks = []
+        pending = []
+        offset = 0
+
+        with open(frequency_file, "r", encoding="utf-8", newline="") as freq_file:
+            for row in csv.reader(freq_file):
+                if not row:
+                    continue
+                (rank, word, part_of_speech) = row
+
+                pending.append(word)
+                offset += len(word)
+                frequency_list.offsets.append(offset)
+                frequency_list.ranks.append(int(rank))
+                if part_of_speech not in pos_index:
+                    pos_index[part_of_speech] = len(frequency_list.pos_names)
+                    frequency_list.pos_names.append(part_of_speech)
+                frequency_list.pos_codes.append(pos_index[part_of_speech])
+
+                if len(pending) >= JOIN_SIZE:
+                    chunks.append("".join(pending))
+                    pending = []
+
+        chunks.append("".join(pending))
+        frequency_list.words = "".join(chunks)
+        frequency_list._build_table()
+        return frequency_list
+
+    def _build_table(self):
+        count = len(self.ranks)
+        size = 8
+        while size < 2 * count:
+            size *= 2
+        self.mask = size - 1
+        self.table = array('q', [_EMPTY]) * size
+        self.length = 0
+
+        for index in range(count):
+            slot = self._find_slot(self.word(index))
+            if self.table[slot] == _EMPTY:
+                self.length += 1
+            self.table[slot] = index
+
+    def word(self, index: int) -> str:
+        return self.words[self.offsets[index]:self.offsets[index + 1]]
+
+    def _find_slot(self, word: str) -> int:
+        """
+        Return the slot holding the word, or the empty slot it would be
+        inserted into.
+        """
+        table, offsets, words, mask = self.table, self.offsets, self.words, self.mask
+        slot = hash(word) & mask
+        length = len(word)
+
+        while True:
+            index = table[slot]
+            if index == _EMPTY:
+                return slot
+            start = offsets[index]
+            if offsets[index + 1] - start == length and words.startswith(word, start):
+                return slot
+            slot = (slot + 1) & mask
+
+    def get(self, word: str, default=None) -> Optional[Tuple[int, str]]:
+        index = self.table[self._find_slot(word)]
+        if index == _EMPTY:
+            return default
+        return (self.ranks[index], self.pos_names[self.pos_codes[index]])
+
+    def __getitem__(self, word: str) -> Tuple[int, str]:
+        entry = self.get(word)
+        if entry is None:
+            raise KeyError(word)
+        return entry
+
+    def __contains__(self, word: str) -> bool:
+        return self.table[self._find_slot(word)] != _EMPTY
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getstate__(self):
+        return (self.words, self.offsets, self.ranks, self.pos_codes, self.pos_names)
+
+    def __setstate__(self, state):
+        (self.words, self.offsets, self.ranks, self.pos_codes, self.pos_names) = state
+        self._build_table()
@@ -1,53 +1,140 @@
 #!/usr/bin/env python3
 
 import argparse
+import bz2
+import gzip
+import lzma
 import xml.sax
 import codecs
+import contextlib
+import io
+import multiprocessing
+import os
 import sys
 
-from typing import TextIO
+import metrics
+from frequency_list import FrequencyList
+from page_store import PageStore, content_hash
+from parser_backends import BACKENDS, iter_records
+from typing import BinaryIO, List, NamedTuple, TextIO, Tuple
+
+# Approximate size of the byte ranges handed to worker processes
+CHUNK_SIZE = 64 * 1024 * 1024
+
+# Approximate size of the compressed byte ranges of multistream dumps handed
+# to worker processes
+MULTISTREAM_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Openers for compressed dumps, chosen by file extension
+DUMP_OPENERS = {
+    ".bz2": bz2.open,
+    ".gz": gzip.open,
+    ".xz": lzma.open,
+}
+
+# Fields of a '<page>' element read by the alternative parser backends
+PAGE_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'revision': 'revision/id',
+    'text': 'revision/text',
+    'sha1': 'revision/sha1',
+}
+
+# State shared with worker processes, set up by '_init_worker'
+_worker_targets = []
+_worker_backend = 'sax'
+_worker_known_pages = {}
+
+class FilterTarget(NamedTuple):
+    """
+    A language to filter pages for, with its frequency list and the output
+    file its pages are written to.
+    """
+    language: str
+    frequency_list: FrequencyList
+    output_file: str
 
 class LanguageFilter(xml.sax.ContentHandler):
 
-    def __init__(self, output_file: TextIO, frequency_list: dict = {}, target_language: str = 'English'):
+    def __init__(self, output_file: TextIO, frequency_list: FrequencyList = FrequencyList(),
+            target_language: str = 'English', known_pages: dict = {}):
         xml.sax.ContentHandler.__init__(self)
         self.output_file = output_file
         self.frequency_list = frequency_list
         self.language_marker = "==" + target_language + "=="
 
+        # Content hashes of pages processed in earlier runs, which are skipped if unchanged
+        self.known_pages = known_pages
+
         # Flag to determine our current position inside the XML file
         self.in_page = False
         self.in_id = False
         self.in_title = False
+        self.in_revision = False
+        self.in_revision_id = False
         self.in_text = False
+        self.in_sha1 = False
+
+        # Flag to determine whether the title of the current page passed the
+        # checks, such that its text needs to be buffered at all
+        self.is_candidate = False
 
         # Variables to hold information about the processed element
         self.id = None
         self.title = None
+        self.revision = None
         self.text = None
+        self.sha1 = None
 
         # Counter to count the number of English word found
         self.filtered_words = 0
         self.all_words = 0
 
+        # Ids of all pages passing the filter, including unchanged ones
+        self.kept_pages = []
+
+        self.metrics = metrics.get_metrics()
+
     def startElement(self, name, attrs):
         if name == "page":
             self.in_page = True
-        if self.in_page and name == "id":
+            self.is_candidate = False
+            self.id = None
+            self.revision = None
+            self.text = None
+            self.sha1 = None
+        if self.in_page and name == "revision":
+            self.in_revision = True
+        # Only the first id of a page is its own and the first id of its revision
+        # is the revision's, later ones belong to its contributor
+        if self.in_page and name == "id" and self.id is None:
             self.in_id = True
+            self.id = []
+        elif self.in_revision and name == "id" and self.revision is None:
+            self.in_revision_id = True
+            self.revision = []
+        if self.in_revision and name == "sha1":
+            self.in_sha1 = True
+            self.sha1 = []
         if self.in_page and name == "title":
             self.in_title = True
-        if self.in_page and name == "text":
+            self.title = []
+        if self.in_page and name == "text" and self.is_candidate:
             self.in_text = True
-            self.text = ""
+            self.text = []
 
     def characters(self, content):
         if self.in_title:
-            self.title = content
+            self.title.append(content)
         elif self.in_id:
-            self.id = content
+            self.id.append(content)
+        elif self.in_revision_id:
+            self.revision.append(content)
         elif self.in_text:
-            self.text += content
+            self.text.append(content)
+        elif self.in_sha1:
+            self.sha1.append(content)
 
     def _append_word(self):
         self.filtered_words += 1
@@ -58,57 +145,350 @@ class LanguageFilter(xml.sax.ContentHandler):
         self.output_file.write("    <title>%s</title>\n" % self.title)
         self.output_file.write("    <pos>%s</pos>\n" % pos)
         self.output_file.write("    <rank>%s</rank>\n" % rank)
+        self.output_file.write("    <revision>%s</revision>\n" % self.revision)
+        self.output_file.write("    <sha1>%s</sha1>\n" % self.sha1)
         self.output_file.write("    <text xml:space=\"preserve\"><![CDATA[\n")
         self.output_file.write("%s\n" % self.text)
         self.output_file.write("    ]]></text>\n")
         self.output_file.write("  </entry>\n")
 
-    def _should_append_word(self):
-        is_in_target_language = self.language_marker in self.text
+    def _should_consider_title(self):
+        """
+        Check whether a page might be appended based on its title alone. This
+        is evaluated as soon as the title is known, such that the text of most
+        pages never needs to be buffered.
+        """
         is_no_category_page = not ":" in self.title
         is_original_page = self.title != self.title.title()
         should_take_all = not self.frequency_list
         is_in_freq_list = self.title in self.frequency_list
 
-        return is_in_target_language \
-            and is_no_category_page \
+        return is_no_category_page \
             and is_original_page \
             and (should_take_all or is_in_freq_list)
 
+    def _should_append_word(self):
+        return self.is_candidate \
+            and self.text is not None \
+            and self.language_marker in self.text
+
+    def _is_unchanged(self):
+        """
+        Check whether the page was already processed in an earlier run and has
+        not changed since.
+        """
+        if self.id not in self.known_pages:
+            return False
+
+        rank, pos = self.frequency_list.get(self.title, (None, None))
+        return self.known_pages[self.id] == content_hash(self.sha1, rank, pos)
+
+    def _end_page(self):
+        self.metrics.count('pages_seen')
+        self._keep_page()
+
+    def _keep_page(self):
+        if self._should_append_word():
+            self.kept_pages.append(self.id)
+            self.metrics.count('pages_kept')
+            if self._is_unchanged():
+                self.metrics.count('pages_unchanged')
+            else:
+                self._append_word()
+
     def endElement(self, name):
         if name == "page":
             self.in_page = False
             self.all_words += 1
-            
-            if self._should_append_word():
-                    self._append_word()
-                    print("Appending " + self.title)
+            self._end_page()
     
         if self.in_page and name == "title":
             self.in_title = False
+            self.title = "".join(self.title)
+            self.is_candidate = self._should_consider_title()
+        # Values may be split into several chunks, e.g. at the boundaries of the parser's buffer
         if self.in_page and name == "id":
+            if self.in_id:
+                self.id = "".join(self.id)
+            elif self.in_revision_id:
+                self.revision = "".join(self.revision)
             self.in_id = False
-        if self.in_page and name == "text":
+            self.in_revision_id = False
+        if self.in_page and name == "revision":
+            self.in_revision = False
+        if self.in_page and name == "sha1" and self.in_sha1:
+            self.in_sha1 = False
+            self.sha1 = "".join(self.sha1)
+        if self.in_page and name == "text" and self.in_text:
             self.in_text = False
+            self.text = "".join(self.text)
+
+    def accepts_title(self, title: str) -> bool:
+        self.title = title
+        return self._should_consider_title()
 
-def read_frequency_list(frequency_file: str) -> dict:
+    def process_record(self, record: dict):
+        """
+        Process a page read by one of the alternative parser backends instead
+        of the SAX events.
+        """
+        self.all_words += 1
+        self.id = record.get('id')
+        self.is_candidate = self.accepts_title(record.get('title', ''))
+        self.revision = record.get('revision')
+        self.text = record.get('text')
+        self.sha1 = record.get('sha1')
+        self._end_page()
+
+class MultiLanguageFilter(LanguageFilter):
+    """
+    Parses each page of a dump once and routes it to the filters of several
+    target languages, each checking the page against its own frequency list
+    and writing it to its own output.
     """
-    Read a word frequency file and return a dictionary mapping word to their
-    rank.
+
+    def __init__(self, filters: List[LanguageFilter]):
+        LanguageFilter.__init__(self, None)
+        self.filters = filters
+
+    def _should_consider_title(self):
+        # Every filter needs to know whether the page is a candidate for it
+        for language_filter in self.filters:
+            language_filter.is_candidate = language_filter.accepts_title(self.title)
+        return any(language_filter.is_candidate for language_filter in self.filters)
+
+    def _keep_page(self):
+        for language_filter in self.filters:
+            if language_filter.is_candidate:
+                language_filter.id = self.id
+                language_filter.revision = self.revision
+                language_filter.text = self.text
+                language_filter.sha1 = self.sha1
+                language_filter._keep_page()
+
+def read_frequency_list(frequency_file: str) -> FrequencyList:
     """
-    frequency_list = {}
-    with open(frequency_file, "r", encoding="utf-8") as freq_file:
-        for line in freq_file.readlines():
-            (rank, word, part_of_speech) = line.strip().split(',')
-            frequency_list[word] = (int(rank), part_of_speech)
-    return frequency_list
+    Read a word frequency file in CSV format and return a mapping of words to
+    their rank and part of speech.
+    """
+    return FrequencyList.from_csv(frequency_file)
+
+def open_dump(wiki_dump_file: str) -> BinaryIO:
+    """
+    Open a (possibly compressed) dump for streaming reads. Compression is
+    detected by the file extension.
+    """
+    opener = DUMP_OPENERS.get(os.path.splitext(wiki_dump_file)[1], open)
+    return opener(wiki_dump_file, "rb")
+
+def _is_compressed(wiki_dump_file: str) -> bool:
+    return os.path.splitext(wiki_dump_file)[1] in DUMP_OPENERS
+
+def _find_page_offset(dump_file, offset: int) -> int:
+    """
+    Return the byte offset of the first '<page>' element starting at or after
+    the given offset, or the end of the file if there is none.
+    """
+    marker = b"<page>"
+    dump_file.seek(offset)
+
+    while True:
+        block = dump_file.read(1024 * 1024)
+        if not block:
+            return dump_file.tell()
+
+        index = block.find(marker)
+        if index >= 0:
+            return offset + index
+
+        # Step back a little in case the marker spans two blocks
+        offset += max(len(block) - len(marker) + 1, 1)
+        dump_file.seek(offset)
+
+def _split_wiki_dump(wiki_dump_file: str, chunk_count: int) -> List[Tuple[int, int]]:
+    """
+    Split an uncompressed dump into byte ranges which each start at a '<page>'
+    element, such that every page is contained in exactly one range.
+    """
+    size = os.path.getsize(wiki_dump_file)
+
+    with open(wiki_dump_file, "rb") as dump_file:
+        offsets = sorted(set(
+            _find_page_offset(dump_file, size * i // chunk_count)
+            for i in range(chunk_count)
+        ))
 
-def filter_wiki_dump(wiki_dump_file: str, frequency_list: dict, output_file: str, target_language: str):
-    with open(output_file, "w", encoding="utf-8") as output_file:
-        with open(wiki_dump_file, "r") as wiki_dump_file:
-            output_file.write("<dictionary>\n")
-            xml.sax.parse(wiki_dump_file, LanguageFilter(output_file, frequency_list, target_language))
-            output_file.write("</dictionary>\n")
+    return [ (start, end) for start, end in zip(offsets, offsets[1:] + [size]) if start < end ]
+
+def _split_multistream_dump(wiki_dump_file: str, index_file: str) -> List[Tuple[int, int]]:
+    """
+    Split a multistream bz2 dump into byte ranges of whole bz2 streams using
+    the stream offsets listed in its index file. Each line of the index has
+    the form 'offset:page_id:title'.
+    """
+    size = os.path.getsize(wiki_dump_file)
+    offsets = []
+
+    with bz2.open(index_file, "rt", encoding="utf-8") as index:
+        for line in index:
+            offset = int(line.split(":", 1)[0])
+            if not offsets or offsets[-1] != offset:
+                offsets.append(offset)
+
+    # Group consecutive streams into ranges of roughly equal size
+    ranges = []
+    start = 0
+    for offset in offsets + [size]:
+        if offset - start >= MULTISTREAM_CHUNK_SIZE or offset == size:
+            if start < offset:
+                ranges.append((start, offset))
+            start = offset
+
+    return ranges
+
+def _page_fragment(data: bytes) -> bytes:
+    """
+    Cut a chunk of a dump down to the '<page>' elements it contains, dropping
+    the surrounding '<mediawiki>' header and footer.
+    """
+    start = data.find(b"<page>")
+    end = data.rfind(b"</page>")
+    if start < 0 or end < 0:
+        return b""
+    return data[start:end + len(b"</page>")]
+
+def parse_pages(source: BinaryIO, language_filter: LanguageFilter, backend: str):
+    """
+    Feed the pages of a dump, or of any fragment of it wrapped in a single
+    root element, to the language filter using the given parser backend.
+    """
+    if backend == 'sax':
+        xml.sax.parse(source, language_filter)
+    else:
+        for record in iter_records(source, 'page', PAGE_FIELDS, language_filter.accepts_title, backend):
+            language_filter.process_record(record)
+
+def _build_filter(output_files: List[TextIO], targets: List[Tuple[str, FrequencyList]],
+        known_pages: dict) -> LanguageFilter:
+    """
+    Create the filter writing the pages of each target language to the
+    output file at the same position.
+    """
+    filters = [
+        LanguageFilter(output_file, frequency_list, target_language, known_pages)
+        for output_file, (target_language, frequency_list) in zip(output_files, targets)
+    ]
+    return filters[0] if len(filters) == 1 else MultiLanguageFilter(filters)
+
+def _kept_pages(language_filter: LanguageFilter) -> List[List[str]]:
+    if isinstance(language_filter, MultiLanguageFilter):
+        return [ target_filter.kept_pages for target_filter in language_filter.filters ]
+    return [ language_filter.kept_pages ]
+
+def _init_worker(targets: List[Tuple[str, FrequencyList]], backend: str, known_pages: dict):
+    global _worker_targets, _worker_backend, _worker_known_pages
+    _worker_targets = targets
+    _worker_backend = backend
+    _worker_known_pages = known_pages
+
+def _filter_chunk(task: Tuple[str, int, int, bool]) -> Tuple[List[str], List[List[str]], dict]:
+    """
+    Filter the pages within a byte range of the dump and return the resulting
+    '<entry>' elements alongside the ids of all pages kept per target language
+    and the counters of the chunk. Ranges of multistream dumps consist of
+    whole bz2 streams and are decompressed first.
+    """
+    metrics.reset_metrics()
+
+    wiki_dump_file, start, end, is_multistream = task
+    with open(wiki_dump_file, "rb") as dump_file:
+        dump_file.seek(start)
+        data = dump_file.read(end - start)
+
+    if is_multistream:
+        data = bz2.decompress(data)
+
+    outputs = [ io.StringIO() for _ in _worker_targets ]
+    language_filter = _build_filter(outputs, _worker_targets, _worker_known_pages)
+    fragment = _page_fragment(data)
+    if fragment:
+        parse_pages(io.BytesIO(b"<pages>" + fragment + b"</pages>"), language_filter, _worker_backend)
+    return [ output.getvalue() for output in outputs ], _kept_pages(language_filter), \
+        dict(metrics.get_metrics().counters)
+
+def _filter_dump(wiki_dump_file: str, targets: List[Tuple[str, FrequencyList]], output_files: List[TextIO],
+        jobs: int, index_file: str, backend: str, known_pages: dict) -> List[List[str]]:
+    """
+    Filter a dump for pages in each of the target languages in a single pass,
+    writing them to the output file at the same position, and return the ids
+    of all pages kept per target language.
+    """
+    run_metrics = metrics.get_metrics()
+
+    if jobs > 1 and _is_compressed(wiki_dump_file) and not index_file:
+        print("Compressed dumps can only be filtered in parallel with a multistream index, using a single process",
+            file=sys.stderr)
+        jobs = 1
+
+    for output_file in output_files:
+        output_file.write("<dictionary>\n")
+
+    if jobs > 1:
+        if index_file:
+            ranges = _split_multistream_dump(wiki_dump_file, index_file)
+        else:
+            chunk_count = max(jobs * 4, os.path.getsize(wiki_dump_file) // CHUNK_SIZE)
+            ranges = _split_wiki_dump(wiki_dump_file, chunk_count)
+        tasks = [ (wiki_dump_file, start, end, bool(index_file)) for start, end in ranges ]
+        kept_pages = [ [] for _ in targets ]
+
+        # 'imap' yields results in submission order, preserving the order of the dump
+        with multiprocessing.Pool(jobs, _init_worker, (targets, backend, known_pages)) as pool:
+            for entries, chunk_kept_pages, counters in pool.imap(_filter_chunk, tasks):
+                for output_file, target_entries in zip(output_files, entries):
+                    output_file.write(target_entries)
+                for target_kept_pages, chunk_target_kept_pages in zip(kept_pages, chunk_kept_pages):
+                    target_kept_pages.extend(chunk_target_kept_pages)
+                for name, value in counters.items():
+                    run_metrics.count(name, value)
+    else:
+        language_filter = _build_filter(output_files, targets, known_pages)
+        with open_dump(wiki_dump_file) as dump_file:
+            parse_pages(dump_file, language_filter, backend)
+        kept_pages = _kept_pages(language_filter)
+
+    for output_file in output_files:
+        output_file.write("</dictionary>\n")
+
+    return kept_pages
+
+def filter_wiki_dump(wiki_dump_file: str, frequency_list: FrequencyList, output_file: str, target_language: str,
+        jobs: int = 1, index_file: str = None, backend: str = 'sax', page_store: PageStore = None):
+    """
+    Filter a dump for pages in the target language. Given a page store,
+    pages which did not change since they were stored are left out of the
+    output, while the ids of all pages kept are recorded in the store.
+    """
+    known_pages = page_store.page_hashes() if page_store else {}
+
+    with open(output_file, "w", encoding="utf-8") as output_file, metrics.get_metrics().stage('filter'):
+        kept_pages, = _filter_dump(wiki_dump_file, [ (target_language, frequency_list) ], [ output_file ], jobs,
+            index_file, backend, known_pages)
+
+    if page_store:
+        page_store.set_current_pages(kept_pages)
+
+def filter_wiki_dump_languages(wiki_dump_file: str, targets: List[FilterTarget], jobs: int = 1,
+        index_file: str = None, backend: str = 'sax'):
+    """
+    Filter a dump for pages in several target languages at once, writing the
+    pages of each language to its own output file. The dump is only read and
+    parsed once, however many languages are filtered for.
+    """
+    with contextlib.ExitStack() as stack, metrics.get_metrics().stage('filter'):
+        output_files = [ stack.enter_context(open(target.output_file, "w", encoding="utf-8")) for target in targets ]
+        _filter_dump(wiki_dump_file, [ (target.language, target.frequency_list) for target in targets ],
+            output_files, jobs, index_file, backend, {})
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Filter word entries from a Wiktionary dump by language.')
@@ -118,18 +498,52 @@ if __name__ == "__main__":
                         + 'For example use "English", "German" or "Finnish" to filter English, '
                         + 'German or Finnish words respectively.')
     parser.add_argument('--frequency-file', '-f', type=str,
-                    required=True,
                     help='CSV file containing words of a language sorted by their frequency.')
+    parser.add_argument('--target', '-t', nargs=3, action='append',
+                    metavar=('LANGUAGE', 'FREQUENCY_FILE', 'OUTPUT_FILE'),
+                    help='Filter words for this language into its own output file. May be given several times '
+                        + 'to filter for all languages in a single pass over the dump, replacing the options '
+                        + '--target-language, --frequency-file and --output-file.')
     parser.add_argument('--wiki-dump-file', '-w', type=str,
                     required=True,
-                    help='Dump of a Wiktionary.')
+                    help='Dump of a Wiktionary. Dumps compressed with bz2, gzip or xz are read directly.')
+    parser.add_argument('--index-file', '-i', type=str,
+                    help='Index of a multistream bz2 dump, allowing its streams to be decompressed in parallel.')
+    parser.add_argument('--parser-backend', '-b', type=str,
+                    choices=BACKENDS, default='sax',
+                    help='XML parser used to read the dump. The "lxml" backend requires lxml to be installed.')
     parser.add_argument('--output-file', '-o', type=str,
                     default='filtered_dictionary.xml',
                     help='Filtered excerpt of Wiktionary dump.')
+    parser.add_argument('--jobs', '-j', type=int,
+                    default=1,
+                    help='Number of worker processes filtering the dump in parallel.')
+    parser.add_argument('--page-store', '-s', type=str,
+                    help='SQLite database of pages processed in earlier runs. Only pages which changed since '
+                        + 'are written to the output file.')
+    metrics.add_arguments(parser)
     args = parser.parse_args()
 
-    # Read the frequency list to filter the words
-    frequency_list = read_frequency_list(args.frequency_file)
+    if args.target and args.page_store:
+        parser.error('--page-store only supports a single target language')
+    if not args.target and not args.frequency_file:
+        parser.error('either --frequency-file or --target is required')
+
+    with metrics.run('language_filter', args):
+        if args.target:
+            # Read the frequency lists & filter the Wiktionary dump for all languages at once
+            targets = [
+                FilterTarget(language, read_frequency_list(frequency_file), output_file)
+                for language, frequency_file, output_file in args.target
+            ]
+            filter_wiki_dump_languages(args.wiki_dump_file, targets, args.jobs, args.index_file, args.parser_backend)
+        else:
+            # Read the frequency list to filter the words
+            frequency_list = read_frequency_list(args.frequency_file)
 
-    # Read & filter the Wiktionary dump
-    filter_wiki_dump(args.wiki_dump_file, frequency_list, args.output_file, args.target_language)
+            # Read & filter the Wiktionary dump
+            page_store = PageStore(args.page_store) if args.page_store else None
+            filter_wiki_dump(args.wiki_dump_file, frequency_list, args.output_file, args.target_language, args.jobs,
+                args.index_file, args.parser_backend, page_store)
+            if page_store:
+                page_store.close()
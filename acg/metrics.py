@@ -0,0 +1,152 @@
+"""
+Metrics of a run shared by all scripts: counters, wall & CPU time per stage,
+throughput, rate-limited progress output, optional profiling and a JSON
+summary of the run.
+
+Modules count into the metrics of the current process returned by
+'get_metrics', which scripts replace by calling 'run' around their work.
+"""
+
+import argparse
+import collections
+import contextlib
+import cProfile
+import json
+import sys
+import threading
+import time
+
+from typing import Iterator, Optional
+
+# Seconds between progress reports
+PROGRESS_INTERVAL = 5.0
+
+
+class Metrics():
+    """
+    Counters and stage timers of a run. Counting is thread-safe and reports
+    progress at most once per 'progress_interval' seconds, while stages are
+    meant to be entered from the main thread only.
+    """
+
+    def __init__(self, name: str = None, progress_interval: Optional[float] = PROGRESS_INTERVAL):
+        self.name = name
+        self.progress_interval = progress_interval
+        self.counters = collections.Counter()
+        self.lock = threading.Lock()
+
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.next_progress = time.monotonic() + progress_interval if progress_interval else None
+
+        # Time per stage, where the time of nested stages is not counted for the enclosing one
+        self.wall = collections.defaultdict(float)
+        self.cpu = collections.defaultdict(float)
+        self.stages = []
+        self.last_wall = self.start_wall
+        self.last_cpu = self.start_cpu
+
+    def count(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] += amount
+        if self.next_progress is not None and time.monotonic() >= self.next_progress:
+            self.next_progress = time.monotonic() + self.progress_interval
+            self.print_progress()
+
+    def _switch_stage(self):
+        wall, cpu = time.perf_counter(), time.process_time()
+        if self.stages:
+            self.wall[self.stages[-1]] += wall - self.last_wall
+            self.cpu[self.stages[-1]] += cpu - self.last_cpu
+        self.last_wall, self.last_cpu = wall, cpu
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        self._switch_stage()
+        self.stages.append(name)
+        try:
+            yield
+        finally:
+            self._switch_stage()
+            self.stages.pop()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start_wall
+
+    def print_progress(self):
+        elapsed = self.elapsed()
+        print("[%s %.0fs] %s" % (self.name, elapsed, ", ".join(
+            "%s %d (%.0f/s)" % (name.replace('_', ' '), value, value / elapsed if elapsed else 0)
+            for name, value in sorted(self.counters.items())
+        )), file=sys.stderr)
+
+    def summary(self) -> dict:
+        elapsed = self.elapsed()
+        return {
+            'name': self.name,
+            'wall_time': elapsed,
+            'cpu_time': time.process_time() - self.start_cpu,
+            'counters': dict(self.counters),
+            'throughput': { name: value / elapsed if elapsed else 0 for name, value in self.counters.items() },
+            'stages': { name: { 'wall_time': self.wall[name], 'cpu_time': self.cpu[name] } for name in self.wall },
+        }
+
+    def print_summary(self):
+        summary = self.summary()
+        for name, value in sorted(summary['counters'].items()):
+            print("%-20s %10d %10.1f/s" % (name.replace('_', ' '), value, summary['throughput'][name]))
+        for name, times in summary['stages'].items():
+            print("%-20s %9.2fs wall %9.2fs CPU" % (name, times['wall_time'], times['cpu_time']))
+        print("%-20s %9.2fs wall %9.2fs CPU" % ("total", summary['wall_time'], summary['cpu_time']))
+
+
+# Metrics of the current process, replaced by 'run'
+_metrics = Metrics(progress_interval=None)
+
+
+def get_metrics() -> Metrics:
+    return _metrics
+
+
+def reset_metrics():
+    """
+    Discard the metrics inherited by a worker process, such that it neither
+    reports progress nor counts towards the run of its parent.
+    """
+    global _metrics
+    _metrics = Metrics(progress_interval=None)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--profile', type=str,
+                    help='Write cProfile statistics of the main process to this file.')
+    parser.add_argument('--metrics-file', type=str,
+                    help='Write a JSON summary of counters, throughput and stage timings to this file.')
+    parser.add_argument('--progress-interval', type=float,
+                    default=PROGRESS_INTERVAL,
+                    help='Seconds between progress reports. Use 0 to disable them.')
+
+
+@contextlib.contextmanager
+def run(name: str, args: argparse.Namespace) -> Iterator[Metrics]:
+    """
+    Collect the metrics of a script's run, configured by the arguments added
+    by 'add_arguments', and report them in the end.
+    """
+    global _metrics
+    _metrics = Metrics(name, args.progress_interval or None)
+    profile = cProfile.Profile() if args.profile else None
+
+    if profile:
+        profile.enable()
+    try:
+        yield _metrics
+    finally:
+        if profile:
+            profile.disable()
+            profile.dump_stats(args.profile)
+
+    _metrics.print_summary()
+    if args.metrics_file:
+        with open(args.metrics_file, "w", encoding="utf-8") as metrics_file:
+            json.dump(_metrics.summary(), metrics_file, indent=4)
@@ -0,0 +1,110 @@
+"""
+Persistent cache of the sections extracted from the pages of a filtered
+dictionary, holding the plain text definition list items of each section
+before their templates are expanded. Cards can be generated again from it
+without parsing the dictionary or any wikitext, e.g. after changing the rules
+of the template processor.
+"""
+
+import hashlib
+import sqlite3
+
+from data.card import dumps, loads
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sections (
+    language TEXT,
+    title TEXT,
+    id TEXT,
+    pos TEXT,
+    rank INTEGER,
+    text_hash TEXT,
+    data TEXT,
+    PRIMARY KEY (language, title)
+);
+"""
+
+
+class ExtractedSection(NamedTuple):
+    """
+    A subsection of the target language section of a page with the plain
+    text of its definition list items.
+    """
+    title: str
+    items: List[str]
+
+
+def text_hash(text: str) -> str:
+    """
+    Identify the wikitext of a page, such that sections extracted from an
+    older version of it are not used anymore.
+    """
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class PageCache():
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def get(self, language: str, title: str, text: str) -> Optional[List[ExtractedSection]]:
+        """
+        Return the sections extracted from the page, or None if it is not
+        cached or its text changed since.
+        """
+        row = self.connection.execute("SELECT text_hash, data FROM sections WHERE language = ? AND title = ?",
+            (language, title)).fetchone()
+        if row is None or row[0] != text_hash(text):
+            return None
+        return [ ExtractedSection(*section) for section in loads(row[1]) ]
+
+    def put(self, language: str, title: str, page_id: str, pos: str, rank: int, text: str,
+            sections: List[ExtractedSection]):
+        """
+        Cache the sections extracted from a page. Changes are only committed
+        by 'commit', rather than once per page.
+        """
+        self.connection.execute("INSERT OR REPLACE INTO sections (language, title, id, pos, rank, text_hash, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (language, title, page_id, pos, rank, text_hash(text), dumps([ list(section) for section in sections ])))
+
+    def update_entry(self, language: str, title: str, page_id: str, pos: str, rank: int):
+        """
+        Update the id, part of speech and rank of a cached page whose text did
+        not change, as they are not covered by its text hash.
+        """
+        self.connection.execute("UPDATE sections SET id = ?, pos = ?, rank = ? WHERE language = ? AND title = ? "
+            "AND (id IS NOT ? OR pos IS NOT ? OR rank IS NOT ?)",
+            (page_id, pos, rank, language, title, page_id, pos, rank))
+
+    def commit(self):
+        self.connection.commit()
+
+    def retain(self, language: str, titles: Iterable[str]):
+        """
+        Delete the cached pages of a language which are not among the given
+        titles, e.g. those missing from the latest dictionary.
+        """
+        with self.connection:
+            self.connection.execute("CREATE TEMPORARY TABLE IF NOT EXISTS retained (title TEXT PRIMARY KEY)")
+            self.connection.execute("DELETE FROM retained")
+            self.connection.executemany("INSERT OR IGNORE INTO retained (title) VALUES (?)",
+                ((title,) for title in titles))
+            self.connection.execute("DELETE FROM sections WHERE language = ? AND title NOT IN "
+                "(SELECT title FROM retained)", (language,))
+
+    def pages(self, language: str) -> Iterator[Tuple[str, str, str, int, List[ExtractedSection]]]:
+        """
+        Iterate over the id, title, part of speech, rank and sections of all
+        cached pages of a language in the order of the dump.
+        """
+        for page_id, title, pos, rank, data in self.connection.execute(
+                "SELECT id, title, pos, rank, data FROM sections WHERE language = ? "
+                "ORDER BY CAST(id AS INTEGER), id", (language,)):
+            yield page_id, title, pos, rank, [ ExtractedSection(*section) for section in loads(data) ]
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
@@ -0,0 +1,145 @@
+"""
+Persistent store of the Wiktionary pages processed in earlier runs alongside
+the cards generated from them, allowing new dumps to be processed
+incrementally.
+"""
+
+import sqlite3
+
+from data.card import Card, loads
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    id TEXT PRIMARY KEY,
+    title TEXT,
+    revision TEXT,
+    content_hash TEXT
+);
+CREATE TABLE IF NOT EXISTS cards (
+    page_id TEXT,
+    position INTEGER,
+    word TEXT,
+    pos TEXT,
+    data TEXT,
+    PRIMARY KEY (page_id, position)
+);
+CREATE TABLE IF NOT EXISTS current_pages (
+    id TEXT PRIMARY KEY
+);
+"""
+
+
+def content_hash(sha1: str, rank, pos) -> str:
+    """
+    Identify the version of a page from the SHA-1 of its revision given by
+    the dump, as well as the frequency list information it is combined with.
+    Pages without a known SHA-1 never match.
+    """
+    if not sha1:
+        return None
+    return "%s:%s:%s" % (sha1, rank, pos)
+
+
+def _occurrence_keys(keys: Iterable[Tuple[str, str]]) -> List[Tuple[str, str, int]]:
+    """
+    Tell apart cards of a page sharing their word and part of speech, e.g. of
+    several etymologies, by the number of such earlier cards.
+    """
+    occurrences = {}
+    occurrence_keys = []
+    for key in keys:
+        occurrence = occurrences.get(key, 0)
+        occurrences[key] = occurrence + 1
+        occurrence_keys.append(key + (occurrence,))
+    return occurrence_keys
+
+
+class PageStore():
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def page_hashes(self) -> Dict[str, str]:
+        """
+        Map the id of each stored page to its content hash.
+        """
+        return dict(self.connection.execute("SELECT id, content_hash FROM pages"))
+
+    def set_current_pages(self, page_ids: Iterable[str]):
+        """
+        Record the ids of all pages kept from the latest dump, whether they
+        changed or not. Stored pages missing from it are removed by
+        'remove_missing_pages'.
+        """
+        with self.connection:
+            self.connection.execute("DELETE FROM current_pages")
+            self.connection.executemany("INSERT OR IGNORE INTO current_pages (id) VALUES (?)",
+                ((page_id,) for page_id in page_ids))
+
+    def _page_cards(self, page_id: str) -> Dict[Tuple[str, str, int], str]:
+        rows = self.connection.execute(
+            "SELECT word, pos, data FROM cards WHERE page_id = ? ORDER BY position", (page_id,)).fetchall()
+        return dict(zip(_occurrence_keys((word, pos) for word, pos, _ in rows), (data for _, _, data in rows)))
+
+    def update_page(self, page_id: str, title: str, revision: str, page_hash: str,
+            cards: List[Card]) -> Tuple[List[Card], List[Card], List[Card]]:
+        """
+        Replace the stored cards of a page and return the added, changed and
+        removed cards. Cards are matched by their word, part of speech and
+        the number of earlier cards of the page sharing both.
+        """
+        old_cards = self._page_cards(page_id)
+        new_cards = dict(zip(_occurrence_keys((card.word, card.pos) for card in cards), cards))
+
+        added = [ card for key, card in new_cards.items() if key not in old_cards ]
+        changed = [
+            card
+            for key, card in new_cards.items()
+            if key in old_cards and loads(old_cards[key]) != card.to_json()
+        ]
+        removed = [ Card.loads(data) for key, data in old_cards.items() if key not in new_cards ]
+
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO pages (id, title, revision, content_hash) "
+                "VALUES (?, ?, ?, ?)", (page_id, title, revision, page_hash))
+            self.connection.execute("DELETE FROM cards WHERE page_id = ?", (page_id,))
+            self.connection.executemany("INSERT INTO cards (page_id, position, word, pos, data) "
+                "VALUES (?, ?, ?, ?, ?)",
+                ((page_id, position, card.word, card.pos, card.dumps())
+                    for position, card in enumerate(cards)))
+
+        return added, changed, removed
+
+    def remove_missing_pages(self) -> List[Card]:
+        """
+        Delete all pages which are not part of the current pages and return
+        their cards. Nothing is removed if no current pages were recorded.
+        """
+        if not self.connection.execute("SELECT 1 FROM current_pages LIMIT 1").fetchone():
+            return []
+
+        missing = "SELECT id FROM pages WHERE id NOT IN (SELECT id FROM current_pages)"
+        removed = [
+            Card.loads(data)
+            for (data,) in self.connection.execute(
+                "SELECT data FROM cards WHERE page_id IN (%s) ORDER BY page_id, position" % missing)
+        ]
+
+        with self.connection:
+            self.connection.execute("DELETE FROM cards WHERE page_id IN (%s)" % missing)
+            self.connection.execute("DELETE FROM pages WHERE id NOT IN (SELECT id FROM current_pages)")
+
+        return removed
+
+    def cards(self) -> Iterator[Card]:
+        """
+        Iterate over all stored cards in the order of the dump.
+        """
+        for (data,) in self.connection.execute(
+                "SELECT data FROM cards ORDER BY CAST(page_id AS INTEGER), page_id, position"):
+            yield Card.loads(data)
+
+    def close(self):
+        self.connection.close()
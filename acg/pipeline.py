@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Run the whole card generation in a single pass: pages kept by the language
+filter are handed straight to the card data generator, whose cards are
+exported into an Anki package as they are generated. The filtered dictionary
+and the card data are only written if requested, e.g. as checkpoints for
+running the separate scripts later on.
+"""
+
+import argparse
+import contextlib
+
+import metrics
+from apkg_exporter import ApkgWriter
+from card_data_generator import CardDataGenerator, Entry, configure_caches
+from data.card import CardWriter
+from language_filter import FilterTarget, LanguageFilter, MultiLanguageFilter, open_dump, parse_pages, \
+    read_frequency_list
+from page_store import PageStore
+from parser_backends import BACKENDS
+from template_processor import TEMPLATE_CACHE_SIZE
+from typing import Callable, List
+
+
+class _EntryFilter(LanguageFilter):
+    """
+    Language filter handing the pages it keeps to a callback instead of only
+    writing them to the filtered dictionary.
+    """
+
+    def __init__(self, handle_entry: Callable[[Entry], None], dictionary_file, frequency_list, target_language,
+            known_pages):
+        LanguageFilter.__init__(self, dictionary_file, frequency_list, target_language, known_pages)
+        self.handle_entry = handle_entry
+
+    def _append_word(self):
+        if self.output_file is not None:
+            LanguageFilter._append_word(self)
+        else:
+            self.filtered_words += 1
+
+        # The text is passed on as it would be read back from the CDATA section of the filtered dictionary
+        rank, pos = self.frequency_list.get(self.title, (None, None))
+        self.handle_entry(Entry(self.id, self.title, pos, rank, self.revision, self.sha1, "\n%s\n    " % self.text))
+
+
+class _CardSink():
+    """
+    Passes each card on to all writers, timing it as part of the export.
+    """
+
+    def __init__(self, writers: List):
+        self.writers = writers
+        self.metrics = metrics.get_metrics()
+
+    def write(self, card):
+        with self.metrics.stage('export'):
+            for writer in self.writers:
+                writer.write(card)
+
+
+def run_pipeline(wiki_dump_file: str, frequency_list, target_language: str, apkg_file: str = None,
+        deck_name: str = "Default", model_name: str = "AnkiDecking", media_dir: str = "resources/tts",
+        dictionary_file: str = None, card_data_file: str = None, backend: str = 'sax', jobs: int = 1,
+        page_store: PageStore = None, diff_filename: str = None):
+    """
+    Filter the dump, generate the cards of all pages kept and export them,
+    streaming every page through all stages within a single process, apart
+    from the worker processes generating cards if 'jobs' is greater than 1.
+    The time spent in each stage is recorded by the metrics of the run.
+    """
+    run_metrics = metrics.get_metrics()
+    known_pages = page_store.page_hashes() if page_store else {}
+
+    with contextlib.ExitStack() as stack:
+        writers = []
+        if card_data_file:
+            writers.append(CardWriter(stack.enter_context(open(card_data_file, "w", encoding="utf-8"))))
+        apkg_writer = ApkgWriter(apkg_file, deck_name, model_name, media_dir) if apkg_file else None
+        if apkg_writer:
+            writers.append(apkg_writer)
+
+        dictionary = stack.enter_context(open(dictionary_file, "w", encoding="utf-8")) if dictionary_file else None
+        if dictionary:
+            dictionary.write("<dictionary>\n")
+
+        card_data_generator = CardDataGenerator(None, target_language, page_store, jobs,
+            card_writer=_CardSink(writers))
+
+        def handle_entry(entry: Entry):
+            with run_metrics.stage('cards'):
+                card_data_generator.process_entry(entry)
+
+        language_filter = _EntryFilter(handle_entry, dictionary, frequency_list, target_language, known_pages)
+        with run_metrics.stage('filter'):
+            with open_dump(wiki_dump_file) as dump_file:
+                parse_pages(dump_file, language_filter, backend)
+
+        if dictionary:
+            dictionary.write("</dictionary>\n")
+        if page_store:
+            page_store.set_current_pages(language_filter.kept_pages)
+
+        with run_metrics.stage('cards'):
+            card_data_generator.finish()
+        if apkg_writer:
+            with run_metrics.stage('export'):
+                apkg_writer.close()
+
+    card_data_generator.print_summary(diff_filename)
+
+
+def run_pipeline_languages(wiki_dump_file: str, targets: List[FilterTarget], deck_name: str = "Default",
+        model_name: str = "AnkiDecking", media_dir: str = "resources/tts", backend: str = 'sax', jobs: int = 1):
+    """
+    Run the pipeline for several target languages in a single pass over the
+    dump, exporting the cards of each language into the Anki package given as
+    the output file of its target.
+    """
+    run_metrics = metrics.get_metrics()
+
+    apkg_writers = []
+    card_data_generators = []
+    filters = []
+    for target in targets:
+        apkg_writer = ApkgWriter(target.output_file, deck_name, model_name, media_dir)
+        card_data_generator = CardDataGenerator(None, target.language, jobs=jobs,
+            card_writer=_CardSink([apkg_writer]))
+
+        def handle_entry(entry: Entry, card_data_generator=card_data_generator):
+            with run_metrics.stage('cards'):
+                card_data_generator.process_entry(entry)
+
+        apkg_writers.append(apkg_writer)
+        card_data_generators.append(card_data_generator)
+        filters.append(_EntryFilter(handle_entry, None, target.frequency_list, target.language, {}))
+
+    with run_metrics.stage('filter'):
+        with open_dump(wiki_dump_file) as dump_file:
+            parse_pages(dump_file, MultiLanguageFilter(filters), backend)
+
+    for target, card_data_generator, apkg_writer in zip(targets, card_data_generators, apkg_writers):
+        with run_metrics.stage('cards'):
+            card_data_generator.finish()
+        with run_metrics.stage('export'):
+            apkg_writer.close()
+        print("%s:" % target.language)
+        card_data_generator.print_summary()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target-language', '-l', type=str,
+                    default='English',
+                    help='Language to filter words for. Use the English name of the language.')
+    parser.add_argument('--frequency-file', '-f', type=str,
+                    help='CSV file containing words of a language sorted by their frequency.')
+    parser.add_argument('--target', '-t', nargs=3, action='append',
+                    metavar=('LANGUAGE', 'FREQUENCY_FILE', 'OUTPUT_FILE'),
+                    help='Create an Anki package of this language. May be given several times to create the '
+                        + 'packages of all languages in a single pass over the dump, replacing the options '
+                        + '--target-language, --frequency-file and --output-file.')
+    parser.add_argument('--wiki-dump-file', '-w', type=str,
+                    required=True,
+                    help='Dump of a Wiktionary. Dumps compressed with bz2, gzip or xz are read directly.')
+    parser.add_argument('--parser-backend', '-b', type=str,
+                    choices=BACKENDS, default='sax',
+                    help='XML parser used to read the dump. The "lxml" backend requires lxml to be installed.')
+    parser.add_argument('--output-file', '-o', type=str,
+                    default='deck.apkg',
+                    help='Anki package to create.')
+    parser.add_argument('--deck-name', '-d', type=str,
+                    default='Default',
+                    help='Name of the card deck into which to add cards.')
+    parser.add_argument('--model-name', '-m', type=str,
+                    default='AnkiDecking',
+                    help='Name of the note type (model) to be created for the cards.')
+    parser.add_argument('--media-dir', type=str,
+                    default='resources/tts',
+                    help='Directory containing the TTS audio files referenced by the cards.')
+    parser.add_argument('--dictionary-file', type=str,
+                    help='Also write the filtered excerpt of the dump to this file.')
+    parser.add_argument('--card-data-file', type=str,
+                    help='Also write the card data in JSON Lines format to this file.')
+    parser.add_argument('--jobs', '-j', type=int,
+                    default=1,
+                    help='Number of worker processes generating cards in parallel.')
+    parser.add_argument('--page-store', '-s', type=str,
+                    help='SQLite database of pages processed in earlier runs. Cards of unchanged pages are taken '
+                        + 'from it.')
+    parser.add_argument('--diff-file', type=str,
+                    help='JSON file to write the cards added, changed or removed since the last run to.')
+    parser.add_argument('--template-cache-size', type=int,
+                    default=TEMPLATE_CACHE_SIZE,
+                    help='Number of distinct expanded templates to cache per process. Use 0 to disable the cache.')
+    parser.add_argument('--definition-cache-size', type=int,
+                    default=0,
+                    help='Number of distinct finalized definitions to cache per process. Disabled by default.')
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.target and (args.dictionary_file or args.card_data_file or args.page_store or args.diff_file):
+        parser.error('--dictionary-file, --card-data-file, --page-store and --diff-file only support a single '
+            + 'target language')
+    if not args.target and not args.frequency_file:
+        parser.error('either --frequency-file or --target is required')
+
+    configure_caches(args.template_cache_size, args.definition_cache_size)
+
+    with metrics.run('pipeline', args):
+        if args.target:
+            targets = [
+                FilterTarget(language, read_frequency_list(frequency_file), output_file)
+                for language, frequency_file, output_file in args.target
+            ]
+            run_pipeline_languages(args.wiki_dump_file, targets, args.deck_name, args.model_name, args.media_dir,
+                args.parser_backend, args.jobs)
+        else:
+            frequency_list = read_frequency_list(args.frequency_file)
+            page_store = PageStore(args.page_store) if args.page_store else None
+            run_pipeline(args.wiki_dump_file, frequency_list, args.target_language, args.output_file,
+                args.deck_name, args.model_name, args.media_dir, args.dictionary_file, args.card_data_file,
+                args.parser_backend, args.jobs, page_store, args.diff_file)
+            if page_store:
+                page_store.close()
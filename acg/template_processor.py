@@ -1,62 +1,102 @@
+import functools
 import re
 
+# Matches the type and arguments of a single template
+TEMPLATE_PATTERN = re.compile(r"{{([^\|]*?)\|(.*?)}}")
+
+# Separates the arguments of a template, skipping empty ones
+ARGS_SEPARATOR = re.compile(r'\|+')
+
+# Default number of distinct template invocations whose results are cached
+TEMPLATE_CACHE_SIZE = 65536
+
 class TemplateProcessor():
 
     @staticmethod
     def process_templates(wiki_text: str):
-        processed_text = wiki_text
-        p = re.compile(r"{{([^\|]*?)\|(.*?)}}")
-        t_coordinates = TemplateProcessor.detect_template_coordinates(processed_text)
+        """
+        Substitute all templates in a single pass, processing the innermost
+        templates first as their closing braces are encountered. Processed
+        templates are fed back into the input, such that braces produced by the
+        substitution are taken into account just like when rescanning the
+        whole text.
+        """
+        if '{{' not in wiki_text and '}}' not in wiki_text:
+            return wiki_text
+
+        global _expansions
+        output = []
+        stack = []
 
-        while t_coordinates:
-            # Extract template information
-            start_index, end_index = t_coordinates.pop(0)
-            m = p.search(processed_text[start_index:end_index])
-            t_type, t_args = (m.group(1), m.group(2)) if m else ('', '')
+        # Remaining input in reverse order, such that the next character is popped from the end
+        pending = list(reversed(wiki_text))
 
-            # Substitute template with processed text
-            processed_template = TemplateProcessor.process_specific_template(t_type, t_args)
-            processed_text = processed_text[:start_index] + processed_template + processed_text[end_index:]
-            t_coordinates = TemplateProcessor.detect_template_coordinates(processed_text)
+        while len(pending) > 1:
+            pair = pending[-1] + pending[-2]
+            if pair == '{{':
+                stack.append(len(output))
+                output.append(pending.pop())
+            elif pair == '}}':
+                start_index = stack.pop()
+                pending.pop()
+                pending.pop()
+                template = ''.join(output[start_index:]) + '}}'
+                del output[start_index:]
+
+                # Extract template information
+                m = TEMPLATE_PATTERN.search(template)
+                t_type, t_args = (m.group(1), m.group(2)) if m else ('', '')
+
+                # Substitute template with processed text and continue right before it,
+                # as the preceding character might now form a pair with the substitution
+                pending.extend(reversed(_expand_template(t_type, t_args)))
+                _expansions += 1
+                if output:
+                    if stack and stack[-1] == len(output) - 1:
+                        stack.pop()
+                    pending.append(output.pop())
+            else:
+                output.append(pending.pop())
 
-        return processed_text
+        output.extend(reversed(pending))
+        return ''.join(output)
 
     @staticmethod
-    def detect_template_coordinates(wiki_text: str):
-        t_coordinates = []
-        stack = []
+    def configure_cache(maxsize: int):
+        """
+        Cache the results of up to 'maxsize' distinct template invocations
+        (type & arguments), discarding the least recently used ones. A size of
+        0 disables the cache.
+        """
+        global _expand_template
+        if maxsize > 0:
+            _expand_template = functools.lru_cache(maxsize)(TemplateProcessor.process_specific_template)
+        else:
+            _expand_template = TemplateProcessor.process_specific_template
 
-        i = 0
-        while i < len(wiki_text) - 1:
-            if wiki_text[i:i+2] == '{{':
-                stack.append(i)
-            elif wiki_text[i:i+2] == '}}':
-                start_index = stack.pop()
-                end_index = i + 2
-                t_coordinates.append((start_index, end_index))
-                i += 1  # next character is already processed -> skip
-            else:
-                pass
-            i += 1
+    @staticmethod
+    def cache_info():
+        """
+        Return the hits & misses of the template cache, or None if disabled.
+        """
+        return _expand_template.cache_info() if hasattr(_expand_template, 'cache_info') else None
 
-        return t_coordinates
+    @staticmethod
+    def expansion_count():
+        """
+        Return the number of templates expanded by this process so far, whether
+        the cache is enabled or not.
+        """
+        return _expansions
 
     @staticmethod
     def process_specific_template(t_type: str, t_args: str):
-        if t_type in ['m', 'mention']:
-            return TemplateProcessor.unchanged_text_with_opt_remark(t_args)
-        elif t_type in ['l', 'link']:
-            return TemplateProcessor.get_second_arg(t_args)
-        elif t_type in ['lb', 'label']:
-            return TemplateProcessor.omit_template()
-        elif t_type in ['gloss', 'qualifier', 'qual', 'q']:
-            return TemplateProcessor.parenthesized_arg(t_args)
-        elif t_type in ['taxlink', 'w', 'n-g', 'non-gloss definition', 'vern']:
-            return TemplateProcessor.get_first_arg(t_args)
-        elif any(particle in t_type for particle in ['for', 'form']) :
+        handler = TEMPLATE_HANDLERS.get(t_type)
+        if handler is not None:
+            return handler(t_type, t_args)
+        elif 'for' in t_type:
+            # Covers both 'for' and 'form' templates such as 'plural form of'
             return TemplateProcessor.leave_marked(t_type, t_args)
-        elif t_type in ['cln']:
-            return TemplateProcessor.omit_template()
         else:
             return TemplateProcessor.omit_template()
 
@@ -67,7 +107,7 @@ class TemplateProcessor():
         optional further remark in quotes and parentheses from the second
         argument, if present.
         """
-        splits = re.split(r'\|+', t_args)
+        splits = ARGS_SEPARATOR.split(t_args)
 
         mention = splits[1]
         if len(splits) == 3:
@@ -77,13 +117,13 @@ class TemplateProcessor():
 
     @staticmethod
     def get_first_arg(t_args: str):
-        splits = re.split(r'\|+', t_args)
+        splits = ARGS_SEPARATOR.split(t_args)
 
         return splits[0]
 
     @staticmethod
     def get_second_arg(t_args: str):
-        splits = re.split(r'\|+', t_args)
+        splits = ARGS_SEPARATOR.split(t_args)
 
         return splits[1]
 
@@ -109,4 +149,23 @@ class TemplateProcessor():
         Omit unknown templates with the assumption that new templates are not
         going to introduce fundamental new information.
         """
-        return ''
\ No newline at end of file
+        return ''
+
+
+def _handler(function, *t_types):
+    return { t_type: function for t_type in t_types }
+
+# Processing of templates by their exact type
+TEMPLATE_HANDLERS = {
+    **_handler(lambda t_type, t_args: TemplateProcessor.unchanged_text_with_opt_remark(t_args), 'm', 'mention'),
+    **_handler(lambda t_type, t_args: TemplateProcessor.get_second_arg(t_args), 'l', 'link'),
+    **_handler(lambda t_type, t_args: TemplateProcessor.omit_template(), 'lb', 'label'),
+    **_handler(lambda t_type, t_args: TemplateProcessor.parenthesized_arg(t_args), 'gloss', 'qualifier', 'qual', 'q'),
+    **_handler(lambda t_type, t_args: TemplateProcessor.get_first_arg(t_args),
+        'taxlink', 'w', 'n-g', 'non-gloss definition', 'vern'),
+    **_handler(lambda t_type, t_args: TemplateProcessor.omit_template(), 'cln'),
+}
+
+_expand_template = None
+_expansions = 0
+TemplateProcessor.configure_cache(TEMPLATE_CACHE_SIZE)
@@ -0,0 +1,41 @@
+"""
+Check the template expansion against a golden corpus of definitions whose
+expected outputs were produced by the original, rescanning implementation of
+'TemplateProcessor.process_templates'. The expansion must stay byte-identical
+unless a rule is changed on purpose, in which case the corpus is updated
+alongside the rule.
+"""
+
+import json
+import os
+
+import pytest
+
+from template_processor import TemplateProcessor
+
+CORPUS_FILE = os.path.join(os.path.dirname(__file__), "data", "template_corpus.jsonl")
+
+
+def _read_corpus():
+    with open(CORPUS_FILE, "r", encoding="utf-8") as corpus:
+        return [ json.loads(line) for line in corpus if line.strip() ]
+
+
+@pytest.fixture(params=[0, 1024], ids=["uncached", "cached"])
+def cache_size(request):
+    previous_info = TemplateProcessor.cache_info()
+    TemplateProcessor.configure_cache(request.param)
+    yield request.param
+    TemplateProcessor.configure_cache(previous_info.maxsize if previous_info else 0)
+
+
+@pytest.mark.parametrize("case", _read_corpus(), ids=lambda case: case['input'][:40])
+def test_process_templates_matches_golden_corpus(case, cache_size):
+    assert TemplateProcessor.process_templates(case['input']) == case['expected']
+
+
+def test_expansions_are_counted_with_and_without_cache(cache_size):
+    start = TemplateProcessor.expansion_count()
+    TemplateProcessor.process_templates("{{l|fi|kuusi}} and {{gloss|{{m|fi|kuusi}}}}")
+    TemplateProcessor.process_templates("{{l|fi|kuusi}}")
+    assert TemplateProcessor.expansion_count() - start == 4
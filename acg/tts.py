@@ -1,56 +1,171 @@
 #!/usr/bin/env python3
 
 import argparse
+import hashlib
 import json
+import os
+import threading
+import time
 
-from data.card import Card
-from google.cloud import texttospeech
+import metrics
+from concurrent.futures import ThreadPoolExecutor
+from data.card import read_cards
+from tts_backends import BACKENDS, create_backend
 
-def synthesize_text(text: str, filename: str, language_code: str = 'fi-FI'):
+# Defaults of the concurrent synthesis of dictionaries
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1.0
+
+# Directory into which the audio files are written, and the manifest recording how they were synthesized
+TTS_DIR = "resources/tts"
+MANIFEST_FILE = "manifest.json"
+
+class RateLimiter():
     """
-    Synthesizes speech from the input string of text.
+    Spaces out requests made from several threads such that at most 'rate'
+    requests are started per second. A rate of 0 disables the limit.
     """
 
-    client = texttospeech.TextToSpeechClient()
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
 
-    input_text = texttospeech.SynthesisInput(text=text)
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
 
-    # Note: the voice can also be specified by name.
-    # Names of voices can be retrieved with client.list_voices().
-    voice = texttospeech.VoiceSelectionParams(
-        language_code=language_code,
-        name=language_code + "-Wavenet-A",
-        ssml_gender=texttospeech.SsmlVoiceGender.FEMALE,
-    )
+class TTSCache():
+    """
+    Content-addressed cache of synthesized audio files. The manifest maps each
+    file to a key derived from everything affecting its audio, such that files
+    are only synthesized again when the text, voice or audio config change.
+    """
 
-    audio_config = texttospeech.AudioConfig(
-        audio_encoding=texttospeech.AudioEncoding.MP3
-    )
+    def __init__(self, directory: str = TTS_DIR):
+        self.path = os.path.join(directory, MANIFEST_FILE)
+        self.directory = directory
+        self.lock = threading.Lock()
+
+        if os.path.isfile(self.path):
+            with open(self.path, "r", encoding="utf-8") as manifest_file:
+                self.manifest = json.load(manifest_file)
+        else:
+            self.manifest = {}
+
+    @staticmethod
+    def key(text: str, language_code: str, voice_name: str, audio_encoding: str) -> str:
+        return hashlib.sha256(json.dumps([text, language_code, voice_name, audio_encoding]).encode("utf-8")).hexdigest()
+
+    def is_cached(self, filename: str, key: str) -> bool:
+        """
+        Whether the audio file exists and matches the key. Files synthesized
+        before the manifest existed are assumed to match.
+        """
+        if not os.path.isfile(os.path.join(self.directory, filename + ".mp3")):
+            return False
+        if filename not in self.manifest:
+            self.add(filename, key)
+        return self.manifest[filename] == key
+
+    def add(self, filename: str, key: str):
+        with self.lock:
+            self.manifest[filename] = key
+
+    def save(self):
+        # Replace the manifest atomically, such that an interrupted run doesn't corrupt it
+        with open(self.path + ".tmp", "w", encoding="utf-8") as manifest_file:
+            json.dump(self.manifest, manifest_file, ensure_ascii=False, indent=0, sort_keys=True)
+        os.replace(self.path + ".tmp", self.path)
+
+def synthesize_text(text: str, filename: str, language_code: str = 'fi-FI', backend=None,
+        output_dir: str = TTS_DIR):
+    """
+    Synthesizes speech from the input string of text.
+    """
 
-    response = client.synthesize_speech(
-        request={"input": input_text, "voice": voice, "audio_config": audio_config}
-    )
+    backend = backend or create_backend()
+    audio_content = backend.synthesize(text, language_code)
 
-    # The response's audio_content is binary.
-    with open("resources/tts/" + filename + ".mp3", "wb") as out:
-        out.write(response.audio_content)
+    with open(os.path.join(output_dir, filename + ".mp3"), "wb") as out:
+        out.write(audio_content)
 
-def synthesize_dictionary(json_path: str):
+def _synthesize_with_retries(text: str, backend, rate_limiter: RateLimiter, retries: int, backoff: float,
+        cache: TTSCache, key: str, language_code: str):
     """
-    Parse the contents of the JSON document containing the card data
-    and synthesize each 'word' element in it.
-
-    :param json_path: the file path of the JSON document file
+    Synthesize a single text, retrying failed requests with an exponentially
+    growing delay.
     """
-    with open(json_path, 'r') as f:
-        json_content = f.read()
-        doc = json.loads(json_content)
-
-        for entry in [ Card.from_json(json_obj) for json_obj in list(doc) ]:
-            if entry.has_definitions():
-                synthesize_text(entry.word, entry.word)
-            else:
-                continue
+    run_metrics = metrics.get_metrics()
+    for attempt in range(retries + 1):
+        rate_limiter.acquire()
+        run_metrics.count('requests_sent')
+        try:
+            synthesize_text(text, text, language_code, backend, cache.directory)
+            cache.add(text, key)
+            run_metrics.count('words_synthesized')
+            return True
+        except Exception as error:
+            if attempt == retries:
+                print("Failed to synthesize %s: %s" % (text, error))
+                run_metrics.count('words_failed')
+                return False
+            time.sleep(backoff * 2 ** attempt)
+
+def synthesize_dictionary(json_path: str, backend: str = 'google', workers: int = None, rate: float = None,
+        retries: int = DEFAULT_RETRIES, backoff: float = DEFAULT_BACKOFF, output_dir: str = TTS_DIR,
+        language_code: str = 'fi-FI'):
+    """
+    Parse the contents of the JSON Lines document containing the card data
+    and synthesize each 'word' element in it. Requests are sent concurrently
+    from several threads sharing a single backend, limited to 'rate' requests
+    per second. Unless given, the number of workers and the rate depend on the
+    backend, e.g. local backends use all cores without a rate limit. Words
+    whose audio is already cached are skipped, as well as words occurring on
+    several cards, e.g. with different parts of speech.
+
+    :param json_path: the file path of the JSON Lines document file
+    """
+    backend = create_backend(backend)
+    workers = workers or backend.default_workers
+    rate_limiter = RateLimiter(backend.default_rate if rate is None else rate)
+    cache = TTSCache(output_dir)
+    voice_name = backend.voice_name(language_code)
+
+    requests = {}
+    hits = duplicates = 0
+    for entry in read_cards(json_path):
+        if not entry.has_definitions():
+            continue
+        if entry.word in requests:
+            duplicates += 1
+            continue
+        key = TTSCache.key(entry.word, language_code, voice_name, backend.audio_encoding)
+        if cache.is_cached(entry.word, key):
+            hits += 1
+            requests[entry.word] = None
+        else:
+            requests[entry.word] = key
+
+    run_metrics = metrics.get_metrics()
+    run_metrics.count('cache_hits', hits)
+    run_metrics.count('duplicate_words', duplicates)
+
+    try:
+        with ThreadPoolExecutor(workers) as executor, run_metrics.stage('synthesis'):
+            results = list(executor.map(
+                lambda item: _synthesize_with_retries(item[0], backend, rate_limiter, retries, backoff, cache, item[1],
+                    language_code),
+                ( (word, key) for word, key in requests.items() if key is not None )))
+    finally:
+        cache.save()
+
+    print("Synthesized %d of %d words" % (sum(results), len(results)))
+    print("Cache hits: %d, duplicate words: %d, API calls saved: %d" % (hits, duplicates, hits + duplicates))
 
 
 if __name__ == "__main__":
@@ -62,11 +177,28 @@ if __name__ == "__main__":
     group.add_argument("--text", "-t",
         help="The text from which to synthesize speech.")
     group.add_argument("--json-file", "-j",
-        help="JSON file containing data with which to create cards")
+        help="JSON Lines file containing data with which to create cards")
+    parser.add_argument("--backend", "-b", choices=BACKENDS, default='google',
+        help="Speech synthesis engine. 'espeak' runs offline using all cores, 'fake' is meant for testing.")
+    parser.add_argument("--workers", "-w", type=int,
+        help="Number of requests sent concurrently. Defaults to a value suited to the backend.")
+    parser.add_argument("--rate", "-r", type=float,
+        help="Maximum number of requests per second. Use 0 for no limit. Defaults to a value suited to the backend.")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES,
+        help="Number of times a failed request is retried.")
+    parser.add_argument("--backoff", type=float, default=DEFAULT_BACKOFF,
+        help="Delay in seconds before the first retry, doubling with each further retry.")
+    parser.add_argument("--output-dir", "-o", default=TTS_DIR,
+        help="Directory into which the audio files and their manifest are written.")
+    parser.add_argument("--language-code", "-l", default='fi-FI',
+        help="BCP-47 code of the language to synthesize, e.g. 'fi-FI' or 'de-DE'.")
+    metrics.add_arguments(parser)
 
     args = parser.parse_args()
 
-    if args.text:
-        synthesize_text(args.text, args.text)
-    else:
-        synthesize_dictionary(args.json_file)
+    with metrics.run('tts', args):
+        if args.text:
+            synthesize_text(args.text, args.text, args.language_code, create_backend(args.backend), args.output_dir)
+        else:
+            synthesize_dictionary(args.json_file, args.backend, args.workers, args.rate, args.retries, args.backoff,
+                args.output_dir, args.language_code)
@@ -0,0 +1,122 @@
+"""
+Speech synthesis engines used by 'tts', all producing MP3 audio for a text in
+a given language. Besides the Google Cloud Text-to-Speech API, speech can be
+synthesized offline with espeak-ng, or faked for testing.
+"""
+
+import os
+import shutil
+import subprocess
+import time
+
+BACKENDS = ('google', 'espeak', 'fake')
+
+
+class GoogleBackend():
+    """
+    Synthesizes speech with the Google Cloud Text-to-Speech API, sharing a
+    single thread-safe client between all requests.
+    """
+
+    # Requests are bound by network latency rather than by local resources
+    default_workers = 8
+    default_rate = 10.0
+    audio_encoding = "MP3"
+
+    def __init__(self, voice_suffix: str = "-Wavenet-A"):
+        from google.cloud import texttospeech
+
+        self.texttospeech = texttospeech
+        self.client = texttospeech.TextToSpeechClient()
+        self.voice_suffix = voice_suffix
+
+    def voice_name(self, language_code: str) -> str:
+        return language_code + self.voice_suffix
+
+    def synthesize(self, text: str, language_code: str) -> bytes:
+        texttospeech = self.texttospeech
+
+        input_text = texttospeech.SynthesisInput(text=text)
+
+        # Note: the voice can also be specified by name.
+        # Names of voices can be retrieved with client.list_voices().
+        voice = texttospeech.VoiceSelectionParams(
+            language_code=language_code,
+            name=self.voice_name(language_code),
+            ssml_gender=texttospeech.SsmlVoiceGender.FEMALE,
+        )
+
+        audio_config = texttospeech.AudioConfig(
+            audio_encoding=getattr(texttospeech.AudioEncoding, self.audio_encoding)
+        )
+
+        response = self.client.synthesize_speech(
+            request={"input": input_text, "voice": voice, "audio_config": audio_config}
+        )
+
+        # The response's audio_content is binary.
+        return response.audio_content
+
+
+class EspeakBackend():
+    """
+    Synthesizes speech offline by running espeak-ng, encoding its WAV output
+    to MP3 with ffmpeg. Each request runs in its own pair of processes, such
+    that as many requests as there are cores are synthesized in parallel.
+    """
+
+    default_workers = os.cpu_count() or 1
+    default_rate = 0
+    audio_encoding = "espeak-ng WAV encoded to MP3 by ffmpeg"
+
+    def __init__(self, espeak: str = "espeak-ng", ffmpeg: str = "ffmpeg"):
+        for program in (espeak, ffmpeg):
+            if shutil.which(program) is None:
+                raise FileNotFoundError("The 'espeak' TTS backend requires '%s' to be installed" % program)
+        self.espeak = espeak
+        self.ffmpeg = ffmpeg
+
+    def voice_name(self, language_code: str) -> str:
+        # espeak-ng names its voices by language only, e.g. 'fi' for 'fi-FI'
+        return language_code.split('-')[0].lower()
+
+    def synthesize(self, text: str, language_code: str) -> bytes:
+        wav = subprocess.run([self.espeak, "-v", self.voice_name(language_code), "--stdout", text],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True).stdout
+        return subprocess.run([self.ffmpeg, "-loglevel", "error", "-f", "wav", "-i", "-", "-f", "mp3", "-"],
+            input=wav, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True).stdout
+
+
+class FakeBackend():
+    """
+    Stand-in which never touches the network, returning the requested text as
+    audio content after a simulated latency.
+    """
+
+    default_workers = 8
+    default_rate = 0
+    audio_encoding = "fake"
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+
+    def voice_name(self, language_code: str) -> str:
+        return "fake"
+
+    def synthesize(self, text: str, language_code: str) -> bytes:
+        time.sleep(self.latency)
+        return text.encode("utf-8")
+
+
+def create_backend(name: str = 'google'):
+    """
+    Create a backend which is thread-safe and reused for all requests.
+    """
+    if name == 'google':
+        return GoogleBackend()
+    elif name == 'espeak':
+        return EspeakBackend()
+    elif name == 'fake':
+        return FakeBackend()
+    else:
+        raise ValueError("Unknown TTS backend '%s'" % name)